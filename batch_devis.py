@@ -0,0 +1,183 @@
+"""
+Génération de devis par lot, sans Streamlit.
+
+Entrée : un fichier JSONL, une demande par ligne :
+    {"id": "...", "client": "Mme BLANC" | {"name": ..., "addr": ...}, "metier": "couvreur", "text": "..."}
+Champs optionnels : "devis_num", "tva", "grosse_cheminee", "conditions".
+
+Sortie : un PDF par demande + un récapitulatif CSV des totaux, écrits au fil de l'eau.
+Une demande invalide donne une ligne en erreur dans le CSV, jamais l'arrêt du lot.
+Relancer la même commande reprend là où elle s'était arrêtée : les id déjà présents
+dans le CSV sans erreur sont sautés, les autres sont retentés et chaque id n'y garde
+qu'une ligne.
+
+    python batch_devis.py demandes.jsonl --out devis/ [--workers 8]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date
+
+from devis import (
+    TRADES, TVA_DEFAULT, CONDITIONS_DEFAULT,
+    extract_couvreur_from_text_advanced, apply_business_rules, compute_totals, make_pdf_devis, QuoteLines,
+)
+
+CSV_FIELDS = ["id", "devis_num", "client", "metier", "n_lines", "subtotal", "tva", "total", "pdf", "error"]
+
+def read_requests(path):
+    """Lit le JSONL ligne à ligne (jamais en entier) ; l'id par défaut est le numéro de ligne."""
+    with open(path, encoding="utf-8") as f:
+        for lineno, raw in enumerate(f, 1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                req = json.loads(raw)
+            except ValueError as e:
+                yield {"id": str(lineno), "_error": f"JSON invalide : {e}"}
+                continue
+            if not isinstance(req, dict):
+                yield {"id": str(lineno), "_error": f"objet JSON attendu, pas {type(req).__name__}"}
+                continue
+            req["id"] = str(req.get("id", lineno))
+            yield req
+
+def done_ids(summary_path):
+    """
+    Id déjà traités sans erreur. Le CSV est réécrit sans ses lignes en erreur : ces id
+    seront retentés et n'y auront ainsi qu'une ligne.
+    """
+    if not os.path.exists(summary_path):
+        return set()
+    with open(summary_path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if not row.get("error")]
+    tmp = summary_path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, summary_path)
+    return {row["id"] for row in rows}
+
+def quote_job(req, company, out_dir, date_str, tva_default):
+    """Traite une demande dans un processus du pool ; le PDF est écrit ici, seul le résumé remonte."""
+    row = {"id": req["id"]}
+    try:
+        if "_error" in req:
+            raise ValueError(req["_error"])
+        client = req.get("client") or {}
+        if isinstance(client, str):
+            client = {"name": client}
+        if not isinstance(client, dict):
+            raise ValueError(f"client : texte ou objet attendu, pas {type(client).__name__}")
+        row.update(client=client.get("name", ""), metier=req.get("metier", "couvreur"))
+        if row["metier"] not in TRADES:
+            raise ValueError(f"métier inconnu : {row['metier']!r}")
+        row["devis_num"] = str(req.get("devis_num") or f"D{date_str.replace('-', '')}-{req['id']}")
+        text = str(req.get("text", ""))
+        lines = []
+        if row["metier"] == "couvreur" and text.strip():
+            lines = extract_couvreur_from_text_advanced(text)
+        lines = QuoteLines(apply_business_rules(row["metier"], lines, grosse_cheminee=bool(req.get("grosse_cheminee"))))
+        tva_rate = float(req.get("tva", tva_default))
+        subtotal, tva, total = compute_totals(lines, tva_rate)
+        row.update(n_lines=len(lines), subtotal=f"{subtotal:.2f}", tva=f"{tva:.2f}", total=f"{total:.2f}")
+
+        pdf_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in row["devis_num"]) + ".pdf"
+        pdf_path = os.path.join(out_dir, pdf_name)
+        # écriture atomique : un arrêt brutal ne laisse jamais de PDF tronqué
+        tmp = pdf_path + ".tmp"
+        make_pdf_devis(
+            company=company,
+            client=client,
+            devis_num=row["devis_num"],
+            date_str=date.fromisoformat(date_str).strftime("%d/%m/%Y"),
+            lines=lines,
+            tva_rate=tva_rate,
+            subtotal=subtotal,
+            tva=tva,
+            total=total,
+            conditions=req.get("conditions", CONDITIONS_DEFAULT),
+            out=tmp,
+        )
+        os.replace(tmp, pdf_path)
+        row["pdf"] = pdf_name
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    summary_path = os.path.join(args.out, "summary.csv")
+    skip = done_ids(summary_path)
+    company = {"name": args.company_name, "addr": args.company_addr, "siret": args.company_siret}
+    workers = args.workers or os.cpu_count() or 1
+    max_pending = workers * 4  # borne la mémoire : on ne lit pas plus loin que ce que le pool absorbe
+
+    new_file = not os.path.exists(summary_path)
+    processed = errors = skipped = 0
+    next_report = args.report_every
+    t0 = time.perf_counter()
+    with open(summary_path, "a", newline="", encoding="utf-8") as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        def drain(pending):
+            nonlocal processed, errors, next_report
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                req_id = pending_ids.pop(fut)
+                try:
+                    row = fut.result()
+                except Exception as e:  # processus du pool perdu, résultat non transmissible…
+                    row = {"id": req_id, "error": f"{type(e).__name__}: {e}"}
+                writer.writerow(row)
+                processed += 1
+                errors += bool(row.get("error"))
+            out.flush()
+            if processed >= next_report:
+                next_report += args.report_every
+                rate = processed / (time.perf_counter() - t0)
+                print(f"{processed} devis ({errors} erreurs) — {rate:.1f} devis/s", file=sys.stderr)
+            return pending
+
+        pending, pending_ids = set(), {}
+        for req in read_requests(args.input):
+            if req["id"] in skip:
+                skipped += 1
+                continue
+            fut = pool.submit(quote_job, req, company, args.out, args.date, args.tva)
+            pending.add(fut)
+            pending_ids[fut] = req["id"]
+            if len(pending) >= max_pending:
+                pending = drain(pending)
+        while pending:
+            pending = drain(pending)
+
+    elapsed = time.perf_counter() - t0
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"Terminé : {processed} devis en {elapsed:.1f} s ({rate:.1f} devis/s, {workers} processus), "
+          f"{errors} erreurs, {skipped} déjà faits.", file=sys.stderr)
+    return 1 if errors else 0
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Génère des devis PDF en lot depuis un fichier JSONL.")
+    p.add_argument("input", help="fichier JSONL des demandes")
+    p.add_argument("--out", default="devis_out", help="dossier des PDF et du summary.csv")
+    p.add_argument("--workers", type=int, default=0, help="processus (défaut : nombre de cœurs)")
+    p.add_argument("--tva", type=float, default=TVA_DEFAULT)
+    p.add_argument("--date", default=date.today().isoformat(), help="date des devis (AAAA-MM-JJ)")
+    p.add_argument("--company-name", default="FactureIA — Couvreur")
+    p.add_argument("--company-addr", default="12 Rue des Toits, 69000 Lyon")
+    p.add_argument("--company-siret", default="SIRET: 123 456 789 00012")
+    p.add_argument("--report-every", type=int, default=100, help="fréquence du rapport de débit")
+    return run(p.parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
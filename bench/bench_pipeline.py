@@ -0,0 +1,173 @@
+"""
+Banc d'essai du pipeline de devis + contrôle de non-régression sur le corpus.
+
+1. Vérifie que chaque demande de bench/corpus.jsonl produit exactement les lignes
+   attendues (clé, quantité) et le sous-total attendu après règles métier.
+2. Mesure chaque étape (extraction, extraction sans mémo, find_qty, règles,
+   totaux, PDF) : débit et latences p50 / p95 / p99.
+3. Compare le p50 de chaque étape à une référence mesurée sur cette machine et
+   échoue si une étape ralentit de plus de --tolerance. La référence n'est pas
+   versionnée (bench/baseline.local.json, ou --baseline) : l'enregistrer avant
+   une modification, la comparer après.
+
+    python bench/bench_pipeline.py --save-baseline  # référence de cette machine, avant la modification
+    python bench/bench_pipeline.py                  # contrôle + mesures + comparaison
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from devis import (
+    extract_couvreur_from_text_advanced, find_qty, apply_business_rules, compute_totals, make_pdf_devis,
+    QuoteLines, CONDITIONS_DEFAULT,
+)
+from devis.extract import _scan_clause_cached
+from devis.metrics import METRICS
+
+CORPUS = os.path.join(HERE, "corpus.jsonl")
+BASELINE = os.path.join(HERE, "baseline.local.json")
+TVA = 10
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(raw) for raw in f if raw.strip()]
+
+def check_corpus(cases):
+    """Renvoie la liste des écarts (vide si tout le corpus est conforme)."""
+    failures = []
+    for case in cases:
+        lines = extract_couvreur_from_text_advanced(case["text"])
+        got = sorted((ln["key"], ln["qty"]) for ln in lines)
+        want = sorted((k, q) for k, q in case["expected"])
+        if got != want:
+            missing = sorted(set(want) - set(got))
+            extra = sorted(set(got) - set(want))
+            failures.append(f"{case['id']}: manquantes {missing}, en trop {extra}")
+            continue
+        ruled = apply_business_rules(case.get("metier", "couvreur"), lines)
+        subtotal = compute_totals(ruled, TVA)[0]
+        if subtotal != case["expected_subtotal"]:
+            failures.append(f"{case['id']}: sous-total {subtotal:.2f} au lieu de {case['expected_subtotal']:.2f}")
+    return failures
+
+def _time_calls(fn, args_list, repeat):
+    samples = []
+    for _ in range(repeat):
+        for args in args_list:
+            t0 = time.perf_counter_ns()
+            fn(*args)
+            samples.append(time.perf_counter_ns() - t0)
+    return samples
+
+def _extract_cold(text):
+    # sans le mémo par membre de phrase : coût réel des règles sur un texte jamais vu
+    _scan_clause_cached.cache_clear()
+    extract_couvreur_from_text_advanced(text)
+
+def _pdf(lines):
+    subtotal, tva, total = compute_totals(lines, TVA)
+    make_pdf_devis({"name": "Bench"}, {"name": "Client"}, "D-BENCH", "01/01/2026",
+                   lines, TVA, subtotal, tva, total, CONDITIONS_DEFAULT)
+
+def run_stages(cases, repeat):
+    texts = [c["text"] for c in cases]
+    lowered = [t.lower() for t in texts]
+    extracted = [extract_couvreur_from_text_advanced(t) for t in texts]
+    ruled = [apply_business_rules("couvreur", lines) for lines in extracted]
+    qlines = [QuoteLines(lines) for lines in ruled]
+    stages = {
+        "extract": (extract_couvreur_from_text_advanced, [(t,) for t in texts]),
+        "extract_cold": (_extract_cold, [(t,) for t in texts]),
+        "find_qty": (find_qty, [(t, u) for t in lowered for u in ("m2", "ml", "u")]),
+        "business_rules": (apply_business_rules, [("couvreur", lines) for lines in extracted]),
+        "totals": (compute_totals, [(lines, TVA) for lines in ruled]),
+        "pdf": (_pdf, [(q,) for q in qlines]),
+    }
+    results = {}
+    for name, (fn, args_list) in stages.items():
+        # le rendu PDF coûte des ms par appel, les autres étapes des µs : moins de répétitions
+        samples = _time_calls(fn, args_list, max(1, repeat // 10) if name == "pdf" else repeat)
+        q = statistics.quantiles(samples, n=100, method="inclusive")
+        results[name] = {
+            "calls": len(samples),
+            "per_s": round(len(samples) / (sum(samples) / 1e9), 1),
+            "p50_ms": round(q[49] / 1e6, 4),
+            "p95_ms": round(q[94] / 1e6, 4),
+            "p99_ms": round(q[98] / 1e6, 4),
+        }
+    return results
+
+def machine():
+    return f"{platform.node()} / {platform.machine()} / Python {platform.python_version()}"
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    regressions = []
+    for name, ref in baseline["stages"].items():
+        cur = results.get(name)
+        # les étapes à la µs sont bruitées : un écart absolu minimal est exigé en plus du relatif
+        if cur and cur["p50_ms"] > ref["p50_ms"] * (1 + tolerance) and cur["p50_ms"] - ref["p50_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p50 {cur['p50_ms']:.3f} ms > {ref['p50_ms']:.3f} ms (+{tolerance:.0%} toléré)")
+    return regressions
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Mesures et non-régression du pipeline de devis.")
+    p.add_argument("--repeat", type=int, default=50, help="passes sur le corpus par étape")
+    p.add_argument("--tolerance", type=float, default=0.25, help="ralentissement toléré du p50 (0.25 = 25 %%)")
+    p.add_argument("--min-delta-ms", type=float, default=0.01, help="écart absolu de p50 ignoré en dessous")
+    p.add_argument("--baseline", default=BASELINE, help="fichier de référence (défaut : bench/baseline.local.json)")
+    p.add_argument("--save-baseline", action="store_true", help="écrit la référence avec ces mesures")
+    p.add_argument("--json", help="écrit aussi les mesures dans ce fichier")
+    p.add_argument("--rule-stats", help="instrumente le contrôle du corpus et écrit les compteurs par règle (JSON)")
+    args = p.parse_args(argv)
+
+    cases = load_corpus()
+    if args.rule_stats:
+        METRICS.enable()
+    failures = check_corpus(cases)
+    if args.rule_stats:
+        METRICS.disable()
+        METRICS.dump_json(args.rule_stats)
+    for f in failures:
+        print("ÉCART", f)
+    print(f"Corpus : {len(cases) - len(failures)}/{len(cases)} demandes conformes")
+
+    results = run_stages(cases, args.repeat)
+    print(f"{'étape':<16}{'appels':>8}{'appels/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['calls']:>8}{r['per_s']:>12.0f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+
+    report = {"machine": machine(), "stages": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 1 if failures else 0
+
+    regressions = []
+    if not os.path.exists(args.baseline):
+        print(f"Pas de référence ({args.baseline}) : lancer avec --save-baseline pour en créer une.")
+    else:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            # des temps d'une autre machine ne disent rien d'une régression
+            print(f"Référence mesurée sur {baseline.get('machine')}, pas sur cette machine : comparaison ignorée.")
+        else:
+            regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+            for r in regressions:
+                print("RÉGRESSION", r)
+    return 1 if failures or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Temps de relance de l'application (streamlit_app.py), tels que l'utilisateur les subit.
+
+Chaque interaction relance tout le script. Ce banc rejoue les interactions hors ligne
+avec AppTest (streamlit.testing) : saisie de la demande, case « Grosse cheminée »,
+curseur de TVA, postes ajoutés depuis le catalogue, relance sans changement.
+
+1. Mesure le temps de chaque relance, regroupé par étape du scénario : p50 / p95 / max.
+   AppTest recompile le script à chaque relance : ce coût fixe est inclus, il ne
+   fausse pas la comparaison entre deux versions.
+2. Mesure le pic de mémoire allouée pendant chaque relance (tracemalloc, dans une
+   session à part pour ne pas fausser les temps).
+3. Avec --sessions N, rejoue le scénario dans N sessions simultanées : débit de
+   relances et latences sous charge. AppTest installe un runtime Streamlit global au
+   processus : chaque session tourne donc dans son propre processus. Un serveur
+   Streamlit sert toutes ses sessions dans un seul processus (un seul GIL) ; le débit
+   mesuré avec une session donne la capacité d'un processus serveur par cœur.
+4. Avec --compare, compare le p50 de chaque étape à un rapport précédent et échoue
+   si une étape ralentit de plus de --tolerance.
+
+    python bench/bench_ui.py --json ui_avant.json        # rapport de référence
+    python bench/bench_ui.py --sessions 20 --compare ui_avant.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import multiprocessing
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+# l'historique des relances mesurées ne doit pas se mêler à la vraie base
+os.environ.setdefault("DEVIS_DB", os.path.join(tempfile.mkdtemp(prefix="bench_ui_"), "devis_history.db"))
+
+from streamlit.testing.v1 import AppTest
+
+from devis import catalog
+
+APP = os.path.join(ROOT, "streamlit_app.py")
+CORPUS = os.path.join(HERE, "corpus.jsonl")
+
+def load_texts(path=CORPUS, limit=3):
+    """Demandes du corpus, les plus longues d'abord (les plus coûteuses à ré-analyser)."""
+    with open(path, encoding="utf-8") as f:
+        texts = [json.loads(raw)["text"] for raw in f if raw.strip()]
+    return sorted(texts, key=len, reverse=True)[:limit]
+
+def scenario(texts, picks):
+    """Étapes (nom, interaction) ; l'interaction prépare l'AppTest, la relance est mesurée à part."""
+    steps = [("saisie", lambda at, t=t: at.text_area(key="user_text").input(t)) for t in texts]
+    steps += [
+        ("grosse_cheminee", lambda at: at.checkbox(key="grosse_cheminee").check()),
+        ("grosse_cheminee", lambda at: at.checkbox(key="grosse_cheminee").uncheck()),
+        ("tva", lambda at: at.slider(key="tva_rate").set_value(10)),
+        ("tva", lambda at: at.slider(key="tva_rate").set_value(20)),
+    ]
+    for k in picks:
+        steps.append(("catalogue", lambda at, k=k: at.multiselect(key="catalog_pick").select(k)))
+        steps.append(("catalogue_qte", lambda at, k=k: at.number_input(key=f"qty_{k}").set_value(4.0)))
+    steps.append(("relance", lambda at: at))
+    return steps
+
+def _rerun(at, name, samples, peaks=None):
+    if peaks is not None:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter_ns()
+    at.run()
+    samples.setdefault(name, []).append(time.perf_counter_ns() - t0)
+    if peaks is not None:
+        peaks.setdefault(name, []).append(tracemalloc.get_traced_memory()[1] - base)
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].value}")
+    if not at.text_area:
+        raise RuntimeError(f"{name}: relance interrompue (page vide)")
+
+def play(steps, timeout, rounds=1, peaks=None):
+    """Une session : premier affichage puis `rounds` passes du scénario. Renvoie {étape: [ns]}."""
+    samples = {}
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    _rerun(at, "chargement", samples, peaks)
+    for _ in range(rounds):
+        for name, interact in steps:
+            interact(at)
+            _rerun(at, name, samples, peaks)
+    return samples
+
+def _quantiles(samples):
+    q = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else [samples[0]] * 99
+    return {"p50_ms": round(q[49] / 1e6, 3), "p95_ms": round(q[94] / 1e6, 3), "max_ms": round(max(samples) / 1e6, 3)}
+
+def measure_memory(steps, timeout):
+    """Pic de mémoire allouée (Ko) par étape, sur une session tracée à part."""
+    peaks = {}
+    tracemalloc.start()
+    try:
+        play(steps, timeout, peaks=peaks)
+    finally:
+        tracemalloc.stop()
+    return {name: round(max(v) / 1024, 1) for name, v in peaks.items()}
+
+def _session(texts, picks, timeout, rounds, barrier, results):
+    steps = scenario(texts, picks)
+    try:
+        play(steps, timeout)  # chauffe : imports, catalogues, index, mémos
+        barrier.wait()
+        t0 = time.monotonic()
+        samples = play(steps, timeout, rounds)
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        results.put((samples, t0, time.monotonic(), rss_mb, None))
+    except Exception as e:
+        barrier.abort()
+        results.put((None, 0.0, 0.0, 0.0, f"{type(e).__name__}: {e}"))
+
+def measure_sessions(texts, picks, timeout, sessions, rounds):
+    """
+    Scénario joué par `sessions` sessions lancées ensemble, une par processus.
+    Renvoie ({étape: [ns]}, durée totale en s, RSS max d'une session en Mo).
+    """
+    barrier, results = multiprocessing.Barrier(sessions), multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_session, args=(texts, picks, timeout, rounds, barrier, results))
+             for _ in range(sessions)]
+    for proc in procs:
+        proc.start()
+    done = [results.get() for _ in procs]  # avant join : une file pleine bloquerait l'enfant
+    for proc in procs:
+        proc.join()
+    errors = [err for *_, err in done if err]
+    if errors:
+        raise RuntimeError(f"{len(errors)} session(s) en échec, dont : {errors[0]}")
+    merged = {}
+    for samples, *_ in done:
+        for name, v in samples.items():
+            merged.setdefault(name, []).extend(v)
+    elapsed = max(end for _, _, end, _, _ in done) - min(start for _, start, _, _, _ in done)
+    return merged, elapsed, max(rss for *_, rss, _ in done)
+
+def machine():
+    return f"{platform.node()} / {platform.machine()} / Python {platform.python_version()}"
+
+def compare(report, previous, tolerance, min_delta_ms):
+    regressions = []
+    for name, ref in previous["steps"].items():
+        cur = report["steps"].get(name)
+        if cur and cur["p50_ms"] > ref["p50_ms"] * (1 + tolerance) and cur["p50_ms"] - ref["p50_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p50 {cur['p50_ms']:.1f} ms > {ref['p50_ms']:.1f} ms (+{tolerance:.0%} toléré)")
+    return regressions
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Temps de relance de l'application sous AppTest.")
+    p.add_argument("--sessions", type=int, default=1, help="sessions simultanées")
+    p.add_argument("--rounds", type=int, default=3, help="passes du scénario par session")
+    p.add_argument("--texts", type=int, default=3, help="demandes du corpus saisies par passe")
+    p.add_argument("--timeout", type=float, default=30.0, help="délai max d'une relance (s)")
+    p.add_argument("--json", help="écrit le rapport dans ce fichier")
+    p.add_argument("--compare", help="rapport précédent (--json) auquel comparer les p50")
+    p.add_argument("--tolerance", type=float, default=0.25, help="ralentissement toléré du p50 (0.25 = 25 %%)")
+    p.add_argument("--min-delta-ms", type=float, default=2.0, help="écart absolu de p50 ignoré en dessous")
+    args = p.parse_args(argv)
+
+    texts, picks = load_texts(limit=args.texts), catalog("couvreur").keys_by_label[:2]
+    steps = scenario(texts, picks)
+    play(steps, args.timeout)  # chauffe avant la session tracée
+    memory = measure_memory(steps, args.timeout)
+    samples, elapsed, rss_mb = measure_sessions(texts, picks, args.timeout, args.sessions, args.rounds)
+
+    n_reruns = sum(len(v) for v in samples.values())
+    report = {
+        "machine": machine(),
+        "sessions": args.sessions,
+        "rounds": args.rounds,
+        "reruns": n_reruns,
+        "reruns_per_s": round(n_reruns / elapsed, 1),
+        "all": _quantiles([s for v in samples.values() for s in v]),
+        "session_rss_mb": round(rss_mb, 1),
+        "steps": {name: {"reruns": len(v), **_quantiles(v), "peak_kb": memory.get(name)} for name, v in samples.items()},
+    }
+
+    print(f"{args.sessions} session(s) × {args.rounds} passe(s) : {n_reruns} relances en {elapsed:.2f} s "
+          f"({report['reruns_per_s']:.1f} relances/s), RSS max d'une session {rss_mb:.0f} Mo")
+    print(f"{'étape':<18}{'relances':>9}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'pic Ko':>10}")
+    for name, r in report["steps"].items():
+        peak = "" if r["peak_kb"] is None else f"{r['peak_kb']:.0f}"
+        print(f"{name:<18}{r['reruns']:>9}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['max_ms']:>10.1f}{peak:>10}")
+    a = report["all"]
+    print(f"{'toutes':<18}{n_reruns:>9}{a['p50_ms']:>10.1f}{a['p95_ms']:>10.1f}{a['max_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("machine") != report["machine"]:
+            print(f"Attention : rapport comparé mesuré sur {previous.get('machine')}, pas sur cette machine.")
+        if previous.get("sessions") != report["sessions"]:
+            print(f"Attention : rapport comparé mesuré avec {previous.get('sessions')} session(s).")
+        regressions = compare(report, previous, args.tolerance, args.min_delta_ms)
+        for r in regressions:
+            print("RÉGRESSION", r)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
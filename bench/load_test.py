@@ -0,0 +1,88 @@
+"""
+Test de charge du service de devis (quote_server.py) en local.
+
+Envoie --requests demandes tirées du corpus, avec --concurrency connexions
+keep-alive en parallèle, puis affiche débit, latences et codes de réponse.
+
+    python quote_server.py &
+    python bench/load_test.py --requests 2000 --concurrency 200 [--pdf-ratio 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_texts():
+    with open(os.path.join(HERE, "corpus.jsonl"), encoding="utf-8") as f:
+        return [json.loads(raw)["text"] for raw in f if raw.strip()]
+
+async def post(reader, writer, host, path, payload):
+    body = json.dumps(payload).encode("utf-8")
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = next(int(h.split(":", 1)[1]) for h in lines[1:] if h.lower().startswith("content-length:"))
+    await reader.readexactly(length)
+    return status
+
+async def client(host, port, jobs, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            path, payload = jobs.pop()
+            t0 = time.perf_counter()
+            try:
+                status = await post(reader, writer, host, path, payload)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                statuses["connexion perdue"] += 1
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            latencies.append(time.perf_counter() - t0)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+async def run(args):
+    texts = load_texts()
+    rnd = random.Random(args.seed)
+    jobs = []
+    for i in range(args.requests):
+        pdf = rnd.random() < args.pdf_ratio
+        payload = {"text": rnd.choice(texts), "metier": "couvreur", "client": f"Client {i}", "devis_num": f"LT-{i}"}
+        jobs.append(("/quote.pdf" if pdf else "/quote", payload))
+    latencies, statuses = [], Counter()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, jobs, latencies, statuses) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    ok = statuses.get(200, 0)
+    print(f"{args.requests} demandes, {args.concurrency} connexions, {elapsed:.2f} s")
+    print(f"débit : {len(latencies) / elapsed:.0f} req/s ({ok / elapsed:.0f} réussies/s)")
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(f"latence ms : p50 {q[49] * 1000:.1f}  p95 {q[94] * 1000:.1f}  p99 {q[98] * 1000:.1f}  max {max(latencies) * 1000:.1f}")
+    print("codes :", dict(statuses))
+    return 0 if ok == args.requests else 1
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Test de charge du service de devis local.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=100)
+    p.add_argument("--pdf-ratio", type=float, default=0.0, help="part des demandes qui réclament le PDF")
+    p.add_argument("--seed", type=int, default=0)
+    return asyncio.run(run(p.parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Moteur de devis FactureIA : catalogue, détection des prestations, règles métier,
+totaux et PDF. Importable sans Streamlit (app, traitements par lot, services, bancs d'essai).
+
+Les sous-modules sont chargés au premier accès à l'un de leurs noms : importer
+`devis` ne coûte presque rien, ReportLab n'est chargé qu'au premier PDF et les
+règles de détection ne sont compilées qu'à la première extraction.
+"""
+import importlib
+
+TVA_DEFAULT = 10
+CONDITIONS_DEFAULT = (
+    "Vérification préalable offerte (couvreur). Remplacement tuiles cassées offert si prestation de nettoyage incluse. "
+    "Prix HT hors échafaudage spécifique. Validité 30 jours. Paiement: 30% acompte, solde à la réception. "
+    "Assurance décennale. Délais selon météo et approvisionnement."
+)
+
+_EXPORTS = {
+    "PRICES": "prices", "TRADES": "prices", "catalog": "prices",
+    "FRENCH_QTY_WORDS": "quantities", "find_qty": "quantities", "index_quantities": "quantities",
+    "nearest_qty": "quantities",
+    "extract_couvreur_from_text_advanced": "extract", "couvreur_rules": "extract", "COUVREUR_RULES": "extract",
+    "add_line": "lines", "QuoteLines": "lines", "compute_totals": "lines", "to_cents": "lines",
+    "apply_business_rules": "rules",
+    "make_pdf_devis": "pdf",
+    "METRICS": "metrics",
+}
+
+__all__ = ["TVA_DEFAULT", "CONDITIONS_DEFAULT", *_EXPORTS]
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'devis' has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
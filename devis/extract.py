@@ -0,0 +1,274 @@
+"""Détection des prestations dans un texte libre (français)."""
+import re
+import time
+from functools import lru_cache
+
+from .fuzzy import trade_index
+from .lines import add_line
+from .metrics import METRICS, timed_stage
+from .prices import catalog
+from .quantities import index_from_clauses, index_quantities, nearest_qty_source, scan_quantities, split_clauses
+
+# --- Table des règles couvreur (compilée au premier usage) ---
+# Chaque règle : (clé, unité de quantité, mots-ancres, chaînes, chaînes d'exclusion).
+# Une chaîne ("a", "b", "c") équivaut à r"a.*b.*c" : chaque segment doit commencer
+# sur la même ligne que la fin du précédent, mais on ne revient jamais en arrière
+# sur un segment déjà trouvé → coût linéaire en longueur de texte.
+# Les ancres sont des sous-chaînes sans accents : si aucune n'est présente dans
+# le texte, la règle n'est même pas évaluée.
+
+_FOLD = str.maketrans("éèêëàâäîïôöûüùç", "eeeeaaaiioouuuc")
+
+def _chain(*segments):
+    first = re.compile(segments[0])
+    rest = tuple(re.compile(r"[^\n]*?(?:" + s + ")") for s in segments[1:])
+    return first, rest
+
+def _rule(key, unit, anchors, *chains, unless=()):
+    return (key, unit, anchors, tuple(_chain(*c) for c in chains), tuple(_chain(*c) for c in unless))
+
+def _chain_search(chain, txt):
+    """
+    Équivalent linéaire de re.search(r"a.*b.*c", txt).
+    Renvoie (match du 1er segment, fin du dernier segment) ou None.
+    """
+    first, rest = chain
+    pos = 0
+    while True:
+        m = first.search(txt, pos)
+        if not m:
+            return None
+        end = m.end()
+        for seg in rest:
+            m2 = seg.match(txt, end)
+            if not m2:
+                break
+            end = m2.end()
+        else:
+            return m, end
+        nl = txt.find("\n", end)
+        if nl < 0:
+            return None
+        pos = nl + 1
+
+_DEPOSE = r"d(é|e)pose"
+_FAITAGE = r"fa[iî]tage"
+_SEC = r"(sec|syst(è|e)me\s+sec)"
+_POSE_TUILES = (r"pose", r"tuiles?")
+
+@lru_cache(maxsize=None)
+def couvreur_rules():
+    """(règles, kit faîtage à sec) compilés au premier appel puis partagés."""
+    rules = (
+        # --- Nettoyage ---
+        _rule("nettoyage_toiture_traitement", "m2", ("toiture",), (r"\btraitement\b", r"toiture"), (r"\btraiter\b", r"toiture")),
+        _rule("nettoyage_toiture_hydrofuge", "m2", ("hydrofuge", "impermeabilis"), (r"\bhydrofuge\b(?!.*color)",), (r"imperm(?:é|e)abilis",)),
+        _rule("nettoyage_toiture_hydrofuge_colore", "m2", ("hydrofuge",), (r"\bhydrofuge\s+color(é|e)",)),
+
+        # --- Faîtage & rives ---
+        _rule("demolition_faitage_maconne_ml", "ml", ("molition",), (r"d(é|e)molition", _FAITAGE, r"ma(ç|c)onn")),
+        _rule("depose_faitage_sec_ml", "ml", ("faitage",), (_DEPOSE, _FAITAGE, _SEC)),
+        _rule("mise_en_place_faitage_sec_ml", "ml", ("faitage",), (r"(mise\s+en\s+place|pose)", _FAITAGE, _SEC)),
+        _rule("chassis_bois_ml", "ml", ("chassis",), (r"ch(a|â)ssis", r"(sapin|bois)")),
+        _rule("ragreage_faitage_maconne_ml", "ml", ("ragreage",), (r"\bragr(é|e)age\b", _FAITAGE)),
+        _rule("ragreage_rives_ml", "ml", ("ragreage",), (r"\bragr(é|e)age\b", r"rives?")),
+        _rule("pose_rives_ml", "ml", ("rive",), (r"(rives?|rive)\b", r"(poser|pose|mise\s+en\s+place)"), (r"\bpose\s+de\s+rives?",)),
+        _rule("resine_hydrofuge_faitage_ml", "ml", ("resine",), (r"r(é|e)sine", r"hydrofuge", _FAITAGE)),
+        _rule("resine_hydrofuge_rives_ml", "ml", ("resine",), (r"r(é|e)sine", r"hydrofuge", r"rives?")),
+        _rule("realisation_faitage_maconne_ml", "ml", ("faitage",), (_FAITAGE, r"(ma(ç|c)onn(é|e)|ancien|ancienne)")),
+
+        # --- Toiture complète ---
+        _rule("depose_toiture_m2", "m2", ("toiture",), (_DEPOSE, r"toiture")),
+        # "liteaux + contre-liteaux" : le "+" sépare deux membres, le contre-liteau suffit
+        _rule("pose_liteaux_m2", "m2", ("liteau",), (r"contre[-\s]?liteau",), (r"mise\s+en\s+place\s+des?\s+liteaux",)),
+        _rule("pose_ecran_sous_toiture_m2", "m2", ("sous", "hpv"), (r"(é|e)cran\s+sous\s+toiture|hpv|sous[-\s]?toiture",)),
+
+        # --- Pose tuiles (types) ---
+        _rule("pose_tuile_dc12_m2", "m2", ("dc",), (*_POSE_TUILES, r"dc\s*12"), (r"dc12",)),
+        _rule("pose_tuile_canal_s_m2", "m2", ("canal",), (*_POSE_TUILES, r"canal\s*s")),
+        _rule("pose_tuile_canal_m2", "m2", ("canal",), (*_POSE_TUILES, r"canal(?!\s*s)")),
+        _rule("pose_tuile_plain_ciel_m2", "m2", ("ciel",), (*_POSE_TUILES, r"plain\s*ciel")),
+        _rule("pose_tuile_g13_m2", "m2", ("g13", "gothique"), (*_POSE_TUILES, r"g13"), (r"gothique",)),
+        _rule("pose_tuile_romane_m2", "m2", ("roman",), (*_POSE_TUILES, r"roman(e|es?)")),
+        _rule("pose_tuile_meridional_m2", "m2", ("ridion",), (*_POSE_TUILES, r"m(é|e)ridion(al|aux|ale|ales)")),
+        _rule("pose_tuile_redland_m2", "m2", ("redland",), (*_POSE_TUILES, r"redland")),
+
+        # --- Tuiles cassées ---
+        _rule("remplacement_tuiles_cassees_u", "u", ("tuil",), (r"(changer|remplacer)\s+(\d+|\w+)\s+tuil",)),
+
+        # --- Zinguerie ---
+        _rule("gouttiere_alu_g300_ml", "ml", ("300",), (r"goutti(è|e)res?", r"alu", r"g\s*300"), (r"g300",)),
+        _rule("gouttiere_zinc_ml", "ml", ("zinc",), (r"goutti(è|e)res?", r"zinc")),
+        _rule("depose_gouttieres_ml", "ml", ("goutti",), (_DEPOSE, r"goutti(è|e)res?")),
+        _rule("entourage_cheminee_forfait", "forfait", ("entourage",), (r"entourage", r"chemin(é|e)e"), unless=((_DEPOSE, r"entourage"),)),
+        _rule("depose_entourage_cheminee_forfait", "forfait", ("entourage",), (_DEPOSE, r"entourage", r"chemin(é|e)e")),
+        _rule("noue_ml", "ml", ("noue",), (r"\bnoues?\b",)),
+        _rule("couloir_zinc_ml", "ml", ("couloir",), (r"couloirs?", r"zinc")),
+        _rule("solin_zinc_alu_ml", "ml", ("solin",), (r"\bsolins?\b",)),
+
+        # --- Habillage & bois ---
+        _rule("avant_toit_pvc_m2", "m2", ("pvc",), (r"avant[-\s]?toit", r"pvc"), (r"sous[-\s]?face", r"pvc"), (r"cache[-\s]?moineaux", r"pvc")),
+        _rule("habillage_planche_rive_pvc_ml", "ml", ("pvc",), (r"habillage", r"planche", r"rive", r"pvc")),
+        _rule("habillage_planche_rive_alu_ml", "ml", ("habillage", "minium"), (r"habillage", r"planche", r"rive", r"alu"), (r"minium",)),
+        _rule("pose_pdr_bois_ml", "ml", ("bois",), (r"\bpdr\b", r"bois"), (r"pi(è|e)ce", r"bois", r"rive")),
+        _rule("remplacement_chevron_u", "u", ("chevron",), (r"(changer|remplacer)\s+(\d+|\w+)\s+chevrons?",)),
+
+        # --- Ouvertures / divers ---
+        # prix de la dépose cheminée ajusté ensuite par switch "grosse cheminée"
+        _rule("depose_cheminee_forfait", "forfait", ("chemin",), (_DEPOSE, r"(chemin(é|e)e)")),
+        _rule("depose_fenetre_toit_fermeture_forfait", "forfait", ("toit", "velux"), (_DEPOSE, r"(fen(ê|e)tre\s+de\s+toit|velux)")),
+        _rule("joint_etancheite_custom", "forfait", ("etanch",), (r"joint", r"(étanch|etanch)")),
+
+        # --- Isolation & charpente ---
+        _rule("isolation_laine_roche_m2", "m2", ("roche",), (r"isolation", r"laine", r"roche")),
+        _rule("isolation_laine_verre_m2", "m2", ("verre",), (r"isolation", r"laine", r"verre")),
+        _rule("isolation_ouate_m2", "m2", ("ouate",), (r"isolation", r"ouate")),
+        _rule("evacuation_ancienne_isolation_m2", "m2", ("isolation",), (r"(é|e)vacuation", r"ancienne", r"isolation")),
+        _rule("traitement_charpente_m2", "m2", ("charpente",), (r"traitement", r"charpente")),
+    )
+    # "15 ml de faîtage à refaire à sec" → kit dépose + mise en place + châssis
+    kit = _chain(r"(\d+[,.]?\d*)\s*(?:m|ml|m(?:è|e)tre?s?)\s+", _FAITAGE, _SEC)
+    return rules, kit
+
+def __getattr__(name):
+    # compatibilité : extract.COUVREUR_RULES déclenche la compilation
+    if name == "COUVREUR_RULES":
+        return couvreur_rules()[0]
+    raise AttributeError(name)
+
+_FAITAGE_SEC_KEYS = ("depose_faitage_sec_ml", "mise_en_place_faitage_sec_ml", "chassis_bois_ml")
+
+def _rule_hit(txt, chains, unless):
+    hit = next(filter(None, (_chain_search(ch, txt) for ch in chains)), None)
+    if hit and any(_chain_search(ch, txt) for ch in unless):
+        return None
+    return hit
+
+# --- Analyse par membre de phrase ---
+# Le texte est découpé en membres (retours à la ligne, virgules, "+", "puis", ";", ".")
+# et chaque règle ne voit qu'un membre : "rive alu 30 ml, mise en place de PDR" ne
+# déclenche plus la pose de rives. Le résultat d'un membre ne dépend que de son texte,
+# il est donc mémorisé : modifier une ligne d'une longue demande ne ré-analyse que
+# les membres modifiés. Seules les quantités sont résolues sur le texte entier
+# (une prestation sans quantité dans son membre prend celle du membre voisin).
+
+CLAUSE_MEMO_SIZE = 4096
+
+def _scan_clause(clause, timings=None):
+    """
+    Règles déclenchées dans un membre (texte en minuscules) :
+    (((n° de règle, début, fin), ...), quantité du kit faîtage à sec ou None, quantités).
+    `timings` (instrumentation) reçoit {n° de règle: (ns, déclenchée)}.
+    """
+    rules, faitage_sec_kit = couvreur_rules()
+    folded = clause.translate(_FOLD)
+    hits = []
+    for i, (key, unit, anchors, chains, unless) in enumerate(rules):
+        if not any(a in folded for a in anchors):
+            continue
+        t0 = time.perf_counter_ns() if timings is not None else 0
+        hit = _rule_hit(clause, chains, unless)
+        if hit:
+            m, end = hit
+            hits.append((i, m.start(), end))
+        if timings is not None:
+            timings[i] = (time.perf_counter_ns() - t0, bool(hit))
+    kit = None
+    if "faitage" in folded:
+        hit = _chain_search(faitage_sec_kit, clause)
+        if hit:
+            kit = float(hit[0].group(1).replace(",", "."))
+    return tuple(hits), kit, scan_quantities(clause)
+
+_scan_clause_cached = lru_cache(maxsize=CLAUSE_MEMO_SIZE)(_scan_clause)
+
+# Rattrapage : un membre de phrase qu'aucune règle n'a reconnu est comparé aux libellés
+# et synonymes du catalogue ("goutiere alu 22 ml", "hydro fuge"). Seule une
+# correspondance nette et non ambiguë ajoute une ligne, marquée "approx".
+FUZZY_MIN_SCORE = 0.7
+FUZZY_MARGIN = 0.1
+FUZZY_MAX_CLAUSE = 160  # au-delà, ce n'est plus une prestation mais du texte libre
+_QTY_UNIT = {"m²": "m2"}  # unité du catalogue → unité de l'index des quantités
+
+def _fuzzy_fallback(trade, txt, spans, covered, qidx, lines):
+    """Complète `lines` avec les membres de phrase non couverts rapprochés du catalogue du métier."""
+    index = trade_index(trade)
+    cat = catalog(trade)
+    present = {ln["key"] for ln in lines}
+    for clause, (start, end) in enumerate(spans):
+        if clause in covered or not 3 <= end - start <= FUZZY_MAX_CLAUSE:
+            continue
+        t0 = time.perf_counter_ns()
+        hit = index.best_match(txt[start:end], FUZZY_MIN_SCORE, FUZZY_MARGIN)
+        source = None
+        if hit and hit[1] not in present:
+            score, key = hit
+            unit = cat[key]["unit"]
+            qty, source = nearest_qty_source(qidx, _QTY_UNIT.get(unit, unit), start, end)
+            add_line(lines, key, qty, meta={"approx": round(score, 2)}, metier=trade)
+            present.add(key)
+        if METRICS.enabled:
+            METRICS.record_rule("fuzzy_fallback", time.perf_counter_ns() - t0, source is not None, source)
+
+@timed_stage("extract")
+def extract_couvreur_from_text_advanced(text: str):
+    """
+    Détecte les prestations couvreur sur un texte libre (français).
+    Couvre tout le catalogue couvreur (catalog/couvreur.json), via la table couvreur_rules().
+    """
+    txt = text.lower()
+    rules = couvreur_rules()[0]
+    seps, spans = split_clauses(txt)
+    instrumented = METRICS.enabled
+    if instrumented:
+        # pas de mémo : chaque évaluation de règle est chronométrée
+        timings = [{} for _ in spans]
+        scans = [_scan_clause(txt[a:b], t) for (a, b), t in zip(spans, timings)]
+    else:
+        scans = [_scan_clause_cached(txt[a:b]) for a, b in spans]
+    qidx = index_from_clauses(seps, [(a, scan[2]) for (a, _), scan in zip(spans, scans)])
+
+    # une ligne par règle, à la première mention ; lignes dans l'ordre de la table
+    first = {}
+    for (offset, _), (hits, _, _) in zip(spans, scans):
+        for i, start, end in hits:
+            if i not in first:
+                first[i] = (offset + start, offset + end)
+    lines = []
+    sources = {}
+    for i in sorted(first):
+        key, unit = rules[i][:2]
+        start, end = first[i]
+        qty, sources[i] = nearest_qty_source(qidx, unit, start, end)
+        add_line(lines, key, qty)
+    if instrumented:
+        for t in timings:
+            for i, (ns, matched) in t.items():
+                METRICS.record_rule(rules[i][0], ns, matched, sources.get(i))
+
+    # --- Cas générique faîtage à sec (phrase courte) ---
+    if not any(ln["key"] in _FAITAGE_SEC_KEYS for ln in lines):
+        qty_ml = next((kit for _, kit, _ in scans if kit is not None), None)
+        if qty_ml is not None:
+            for key in _FAITAGE_SEC_KEYS:
+                add_line(lines, key, qty_ml)
+            if instrumented:
+                METRICS.record_rule("faitage_sec_kit", 0, True, "kit")
+
+    covered = {c for c, (hits, kit, _) in enumerate(scans) if hits or kit is not None}
+    _fuzzy_fallback("couvreur", txt, spans, covered, qidx, lines)
+
+    # Surfaces / tuiles sans quantité → on laisse 0 pour que l'artisan ajuste
+    return lines
+
+@timed_stage("extract")
+def extract_from_catalog(trade, text):
+    """
+    Extraction générique pour un métier sans table de règles : chaque membre de phrase
+    est rapproché des libellés et synonymes de son catalogue (lignes marquées "approx").
+    """
+    txt = text.lower()
+    spans = split_clauses(txt)[1]
+    lines = []
+    _fuzzy_fallback(trade, txt, spans, (), index_quantities(txt), lines)
+    return lines
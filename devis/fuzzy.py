@@ -0,0 +1,137 @@
+"""
+Recherche approchée dans le catalogue : index de trigrammes sur les libellés et synonymes.
+
+"goutiere", "faitage" sans accent ou "hydro fuge" partagent l'essentiel de leurs
+trigrammes avec le libellé exact ; on compte ces trigrammes communs à l'aide de
+listes inversées (trigramme → postes), sans jamais comparer la requête à tout le
+catalogue. Sert au sélecteur de postes (classement) et au rattrapage des membres de
+phrase qu'aucune règle de détection n'a reconnus.
+"""
+import re
+from collections import Counter
+
+from .prices import TRADES, catalog, fold
+
+# mots outils et unités : trop fréquents pour départager deux postes
+_STOPWORDS = frozenset("les des une sur pour avec par dans aux sans ancien ancienne anciens anciennes".split())
+_WORD = re.compile(r"[a-z0-9]+")
+MATCH_MEMO_SIZE = 4096
+
+def trigrams(text):
+    """Trigrammes des mots du texte (sans accents, mots de 3 lettres ou plus, bordés d'un espace)."""
+    grams = set()
+    for w in _WORD.findall(fold(text)):
+        if len(w) < 3 or w.isdigit() or w in _STOPWORDS:
+            continue
+        w = f" {w} "
+        grams.update(w[i:i + 3] for i in range(len(w) - 2))
+    return grams
+
+class TrigramIndex:
+    """Index inversé trigramme → documents ; un document = (valeur, texte)."""
+
+    def __init__(self, entries):
+        self.values = []
+        self.sizes = []
+        self.postings = {}
+        self._matches = {}  # best_match mémorisé par texte (les membres de phrase se répètent)
+        for value, text in entries:
+            grams = trigrams(text)
+            if not grams:
+                continue
+            doc = len(self.values)
+            self.values.append(value)
+            self.sizes.append(len(grams))
+            for g in grams:
+                self.postings.setdefault(g, []).append(doc)
+
+    def __len__(self):
+        return len(self.values)
+
+    def _shared(self, grams):
+        counts = Counter()
+        for g in grams:
+            docs = self.postings.get(g)
+            if docs:
+                counts.update(docs)
+        return counts
+
+    def search(self, query, limit=10, min_score=0.3):
+        """
+        Valeurs les plus proches de `query`, triées : [(score, valeur)], une fois chacune.
+        Score = part des trigrammes de la requête présents dans le document (une saisie
+        partielle « goutt » trouve donc « Gouttière alu G300 ») ; à égalité, le document
+        le plus court l'emporte.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        n = len(grams)
+        best = {}
+        for doc, shared in self._shared(grams).most_common():
+            score = shared / n
+            if score < min_score:
+                break  # triés par trigrammes communs décroissants : les suivants sont en dessous
+            rank = (score, shared / (n + self.sizes[doc] - shared))
+            value = self.values[doc]
+            if rank > best.get(value, (0.0, 0.0)):
+                best[value] = rank
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(round(rank[0], 3), value) for value, rank in ranked]
+
+    def best_match(self, text, min_score=0.7, margin=0.1):
+        """
+        Document qui correspond sans ambiguïté à `text` (un membre de phrase) : (score, valeur) ou None.
+        Score = trigrammes communs / trigrammes du plus long des deux : le texte doit couvrir
+        le document et réciproquement (« évacuation des gravats » ne vaut pas « Dépose toiture
+        + évacuation gravats »). Le second candidat doit être distancé de `margin`, sinon
+        « pose … » tout court désignerait n'importe quelle pose.
+        """
+        memo_key = (text, min_score, margin)
+        if memo_key in self._matches:
+            return self._matches[memo_key]
+        if len(self._matches) >= MATCH_MEMO_SIZE:
+            self._matches.clear()
+        grams = trigrams(text)
+        n = len(grams)
+        floor = (min_score - margin) * n  # score ≤ communs / n : en dessous, ni gagnant ni rival
+        best = {}
+        for doc, shared in self._shared(grams).most_common():
+            if shared < floor:
+                break
+            score = shared / max(n, self.sizes[doc])
+            value = self.values[doc]
+            if score > best.get(value, 0.0):
+                best[value] = score
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        match = None
+        if ranked and ranked[0][1] >= min_score and (len(ranked) == 1 or ranked[0][1] - ranked[1][1] >= margin):
+            match = ranked[0][1], ranked[0][0]
+        self._matches[memo_key] = match
+        return match
+
+def catalog_entries(cat):
+    """(clé, texte) pour le libellé et chaque synonyme des postes d'un catalogue."""
+    for key, cfg in cat.items.items():
+        yield key, cfg["label"]
+        for syn in cfg.get("synonyms", ()):
+            yield key, syn
+
+def trade_index(trade):
+    """Index du métier, construit une fois par version chargée du catalogue."""
+    cat = catalog(trade)
+    if cat.fuzzy_index is None:
+        cat.fuzzy_index = TrigramIndex(catalog_entries(cat))
+    return cat.fuzzy_index
+
+def search_catalog(query, trades=TRADES, limit=10, min_score=0.3):
+    """Postes proches de `query` sur plusieurs métiers : [(score, métier, clé)], meilleurs d'abord."""
+    hits = []
+    for trade in trades:
+        try:
+            index = trade_index(trade)
+        except KeyError:
+            continue
+        hits.extend((score, trade, key) for score, key in index.search(query, limit, min_score))
+    hits.sort(key=lambda h: h[0], reverse=True)
+    return hits[:limit]
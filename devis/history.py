@@ -0,0 +1,255 @@
+"""
+Historique des devis dans SQLite (mode WAL) et numérotation atomique par jour.
+
+Chaque devis enregistré garde son en-tête (client, métier, saisie, options), ses
+lignes, ses totaux en centimes et son PDF. Une ligne tirée du catalogue garde aussi le
+PU du catalogue au moment du chiffrage ("catalog_price") : la réévaluation (devis.reprice)
+y reconnaît un PU saisi à la main. Les numéros D<aaaammjj>-<n> viennent
+d'une séquence par jour incrémentée dans une seule instruction : deux sessions
+(ou deux processus) ne reçoivent jamais le même numéro.
+
+Les recherches (client, période, métier, poste du catalogue) passent toutes par un
+index ; le PDF est rangé à part pour que les listes ne lisent jamais les blobs.
+Base : DEVIS_DB, sinon devis_history.db à la racine du dépôt.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from .lines import QuoteLines
+from .prices import catalog, fold
+
+DB_PATH = os.environ.get("DEVIS_DB") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "devis_history.db")
+BUSY_TIMEOUT_S = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devis_seq (
+    day  TEXT PRIMARY KEY,
+    last INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quotes (
+    id          INTEGER PRIMARY KEY,
+    devis_num   TEXT NOT NULL UNIQUE,
+    day         TEXT NOT NULL,          -- aaaa-mm-jj
+    saved_at    REAL NOT NULL,
+    metier      TEXT NOT NULL,
+    client      TEXT NOT NULL,
+    client_fold TEXT NOT NULL,          -- minuscules sans accents, pour la recherche par préfixe
+    tva_rate    REAL NOT NULL,
+    subtotal_c  INTEGER NOT NULL,
+    tva_c       INTEGER NOT NULL,
+    total_c     INTEGER NOT NULL,
+    n_lines     INTEGER NOT NULL,
+    header      TEXT NOT NULL,          -- JSON : client, société, saisie, options
+    lines       TEXT NOT NULL           -- JSON : lignes après règles métier
+);
+CREATE INDEX IF NOT EXISTS quotes_client ON quotes (client_fold, day);
+CREATE INDEX IF NOT EXISTS quotes_day ON quotes (day);
+CREATE INDEX IF NOT EXISTS quotes_metier ON quotes (metier, day);
+CREATE TABLE IF NOT EXISTS quote_keys (      -- poste du catalogue → devis, déjà trié par date
+    key      TEXT NOT NULL,
+    day      TEXT NOT NULL,
+    quote_id INTEGER NOT NULL REFERENCES quotes (id) ON DELETE CASCADE,
+    PRIMARY KEY (key, day, quote_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS quote_keys_quote ON quote_keys (quote_id);
+CREATE TABLE IF NOT EXISTS quote_pdfs (
+    quote_id INTEGER PRIMARY KEY REFERENCES quotes (id) ON DELETE CASCADE,
+    pdf      BLOB NOT NULL
+);
+"""
+
+_REPLACE = (
+    " ON CONFLICT (devis_num) DO UPDATE SET day = excluded.day, saved_at = excluded.saved_at,"
+    " metier = excluded.metier, client = excluded.client, client_fold = excluded.client_fold,"
+    " tva_rate = excluded.tva_rate, subtotal_c = excluded.subtotal_c, tva_c = excluded.tva_c,"
+    " total_c = excluded.total_c, n_lines = excluded.n_lines, header = excluded.header,"
+    " lines = excluded.lines"
+)
+_SUMMARY = "devis_num, quotes.day, metier, client, n_lines, subtotal_c, tva_c, total_c"
+
+def _day(d):
+    if isinstance(d, str):
+        return d
+    return (d or date.today()).isoformat()
+
+def _catalog_price(ln, metier):
+    """PU du catalogue pour la ligne : celui qu'elle porte déjà, sinon celui du catalogue chargé, sinon None."""
+    if "catalog_price" in ln:
+        return ln["catalog_price"]
+    try:
+        cfg = catalog(ln.get("metier") or metier).items.get(ln.get("key"))
+    except KeyError:
+        return None
+    return None if cfg is None else cfg["unit_price"]
+
+def _with_catalog_price(lines, metier):
+    out = []
+    for ln in lines:
+        price = _catalog_price(ln, metier)
+        out.append(ln if price is None else {**ln, "catalog_price": price})
+    return out
+
+class QuoteHistory:
+    """Accès à la base d'historique ; une connexion par thread, schéma créé au premier accès."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # autocommit : les transactions d'écriture sont ouvertes explicitement (BEGIN IMMEDIATE)
+            con = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")  # lecteurs jamais bloqués par une écriture
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA foreign_keys=ON")
+            with self._lock:
+                if not self._ready:
+                    con.executescript(_SCHEMA)
+                    self._ready = True
+            self._local.con = con
+        return con
+
+    def next_devis_num(self, day=None):
+        """Réserve le prochain numéro du jour (D20261017-001, -002, …)."""
+        day = _day(day)
+        (n,) = self._con().execute(
+            "INSERT INTO devis_seq (day, last) VALUES (?, 1) "
+            "ON CONFLICT (day) DO UPDATE SET last = last + 1 RETURNING last", (day,)).fetchone()
+        return f"D{day.replace('-', '')}-{n:03d}"
+
+    def exists(self, devis_num):
+        return self._con().execute("SELECT 1 FROM quotes WHERE devis_num = ?", (devis_num,)).fetchone() is not None
+
+    def save(self, devis_num, metier, client, lines, tva_rate, header=None, pdf=None, day=None, replace=False):
+        """
+        Enregistre un devis ; `lines` = lignes après règles métier. Un numéro déjà enregistré
+        n'est remplacé que si `replace` (devis rechargé puis corrigé), sinon ValueError.
+        """
+        # métier (devis multi-métiers), marque des lignes ajoutées par une règle et PU du catalogue :
+        # gardés s'ils sont connus
+        lines = [{"key": ln.get("key", ""), "label": ln["label"], "unit": ln["unit"], "unit_price": ln["unit_price"],
+                  "qty": ln["qty"], **{k: ln[k] for k in ("metier", "rule", "catalog_price") if k in ln}}
+                 for ln in _with_catalog_price(lines, metier)]
+        subtotal_c, tva_c, total_c = QuoteLines(lines).totals_c(tva_rate)
+        header = dict(header or {}, client=client)
+        if header.get("extra_lines"):
+            header["extra_lines"] = _with_catalog_price(header["extra_lines"], metier)
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            (quote_id,) = con.execute(
+                "INSERT INTO quotes (devis_num, day, saved_at, metier, client, client_fold, tva_rate,"
+                " subtotal_c, tva_c, total_c, n_lines, header, lines)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)" + (_REPLACE if replace else "") + " RETURNING id",
+                (devis_num, _day(day), time.time(), metier, client.get("name", ""), fold(client.get("name", "")),
+                 tva_rate, subtotal_c, tva_c, total_c, len(lines),
+                 json.dumps(header, ensure_ascii=False), json.dumps(lines, ensure_ascii=False))).fetchone()
+            con.execute("DELETE FROM quote_keys WHERE quote_id = ?", (quote_id,))
+            con.executemany("INSERT OR IGNORE INTO quote_keys (key, day, quote_id) VALUES (?, ?, ?)",
+                            [(ln["key"], _day(day), quote_id) for ln in lines if ln["key"]])
+            if pdf is not None:
+                con.execute("INSERT OR REPLACE INTO quote_pdfs (quote_id, pdf) VALUES (?, ?)", (quote_id, pdf))
+            con.execute("COMMIT")
+        except sqlite3.IntegrityError as e:
+            con.execute("ROLLBACK")
+            if "devis_num" not in str(e):
+                raise
+            raise ValueError(f"le n° {devis_num} est déjà celui d'un autre devis enregistré") from None
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return quote_id
+
+    def search(self, client=None, date_from=None, date_to=None, metier=None, key=None, limit=50):
+        """Résumés des devis correspondants, du plus récent au plus ancien (sans les lignes ni le PDF)."""
+        # avec un poste, on parcourt son index (déjà trié par date) et on filtre le reste au fil de l'eau
+        table, day_col, order = "quotes", "day", "day DESC, id DESC"
+        where, args = [], []
+        if key:
+            table = "quote_keys JOIN quotes ON quotes.id = quote_keys.quote_id"
+            day_col, order = "quote_keys.day", "quote_keys.day DESC, quote_keys.quote_id DESC"
+            where.append("key = ?")
+            args.append(key)
+        if client:
+            # préfixe sur la colonne indexée, sans LIKE (qui ignorerait l'index)
+            where.append("client_fold >= ? AND client_fold < ?")
+            args += [fold(client), fold(client) + "\uffff"]
+        if date_from:
+            where.append(f"{day_col} >= ?")
+            args.append(_day(date_from))
+        if date_to:
+            where.append(f"{day_col} <= ?")
+            args.append(_day(date_to))
+        if metier:
+            where.append("metier = ?")
+            args.append(metier)
+        sql = f"SELECT {_SUMMARY} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        return [dict(r) for r in self._con().execute(sql, (*args, limit))]
+
+    def load(self, devis_num):
+        """Devis complet (en-tête, lignes, totaux) en une requête, ou None."""
+        row = self._con().execute(
+            f"SELECT {_SUMMARY}, tva_rate, header, lines FROM quotes WHERE devis_num = ?", (devis_num,)).fetchone()
+        if row is None:
+            return None
+        rec = dict(row)
+        rec["header"] = json.loads(rec["header"])
+        rec["lines"] = json.loads(rec["lines"])
+        return rec
+
+    def records(self, date_from=None, date_to=None, metier=None, batch=500):
+        """Devis complets (comme load), dans l'ordre d'enregistrement, lus par paquets de `batch`."""
+        where, args = ["id > ?"], []
+        if date_from:
+            where.append("day >= ?")
+            args.append(_day(date_from))
+        if date_to:
+            where.append("day <= ?")
+            args.append(_day(date_to))
+        if metier:
+            where.append("metier = ?")
+            args.append(metier)
+        sql = (f"SELECT id, {_SUMMARY}, tva_rate, header, lines FROM quotes"
+               f" WHERE {' AND '.join(where)} ORDER BY id LIMIT ?")
+        last = 0
+        while True:
+            # pagination par id : aucun curseur ouvert entre deux paquets, l'appelant peut réécrire les devis lus
+            rows = self._con().execute(sql, (last, *args, batch)).fetchall()
+            for row in rows:
+                rec = dict(row)
+                rec["header"] = json.loads(rec["header"])
+                rec["lines"] = json.loads(rec["lines"])
+                yield rec
+            if len(rows) < batch:
+                return
+            last = rows[-1]["id"]
+
+    def pdf(self, devis_num):
+        row = self._con().execute(
+            "SELECT pdf FROM quote_pdfs JOIN quotes ON quotes.id = quote_pdfs.quote_id WHERE devis_num = ?",
+            (devis_num,)).fetchone()
+        return None if row is None else row[0]
+
+_history = None
+_history_lock = threading.Lock()
+
+def quote_history():
+    """Historique partagé (base DB_PATH)."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = QuoteHistory()
+        return _history
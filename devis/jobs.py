@@ -0,0 +1,51 @@
+"""
+Rendu PDF en arrière-plan, dans un pool partagé par toutes les sessions du serveur.
+
+submit_pdf() renvoie immédiatement un Future dont le résultat est le PDF en bytes.
+Le pool est à threads par défaut ; DEVIS_PDF_POOL=process le remplace par des
+processus (démarrés en "spawn" : on ne forke pas un serveur multi-thread).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+POOL_KIND = os.environ.get("DEVIS_PDF_POOL", "thread")
+POOL_SIZE = int(os.environ.get("DEVIS_PDF_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+_ms_per_line = 0.5  # moyenne glissante observée, sert à estimer la progression
+
+def pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if POOL_KIND == "process":
+                _pool = ProcessPoolExecutor(max_workers=POOL_SIZE, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="pdf")
+        return _pool
+
+def render_pdf_bytes(**kwargs):
+    from .pdf import make_pdf_devis  # ReportLab chargé dans le worker, au premier rendu
+    return make_pdf_devis(**kwargs).getvalue()
+
+def submit_pdf(**kwargs):
+    """Lance le rendu (mêmes arguments que make_pdf_devis) et renvoie son Future."""
+    n_lines = max(1, len(kwargs.get("lines", ())))
+    started = time.perf_counter()
+
+    def learn(fut):
+        global _ms_per_line
+        if not fut.cancelled() and fut.exception() is None:
+            ms = (time.perf_counter() - started) * 1000 / n_lines
+            _ms_per_line = 0.8 * _ms_per_line + 0.2 * ms
+
+    fut = pdf_pool().submit(render_pdf_bytes, **kwargs)
+    fut.add_done_callback(learn)
+    return fut
+
+def estimated_seconds(n_lines):
+    return max(1, n_lines) * _ms_per_line / 1000
@@ -0,0 +1,71 @@
+"""Lignes de devis : création depuis le catalogue, colonnes compactes et totaux en centimes."""
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+from .prices import catalog
+from .metrics import timed_stage
+
+def add_line(lines, key, qty, meta=None, metier="couvreur"):
+    cfg = catalog(metier)[key]
+    ln = {"key": key, "label": cfg["label"], "unit": cfg["unit"], "unit_price": cfg["unit_price"], "qty": float(qty)}
+    if meta:
+        ln.update(meta)
+    lines.append(ln)
+
+# Les montants sont calculés une seule fois, en centimes entiers : l'aperçu, le PDF
+# et les totaux lisent le même résultat, sans écart d'arrondi entre eux. Quantités et
+# PU sont d'abord arrondis au centième (0,125 m² compte pour 0,13 m², demi vers le haut) :
+# c'est la quantité affichée, à deux décimales, sur l'aperçu et le PDF.
+
+_ONE = Decimal(1)
+
+@lru_cache(maxsize=4096)
+def to_cents(x):
+    """Montant (ou quantité) en centièmes, arrondi au plus proche (demi vers le haut), sans erreur binaire."""
+    return int((Decimal(repr(float(x))) * 100).quantize(_ONE, ROUND_HALF_UP))
+
+def _div_round(n, d):
+    """n / d arrondi demi vers le haut (en valeur absolue), en entiers."""
+    q, r = divmod(abs(n), d)
+    q += 2 * r >= d
+    return q if n >= 0 else -q
+
+class QuoteLines:
+    """
+    Lignes du devis en colonnes compactes : quantités et PU en centièmes (array 'q'),
+    total de chaque ligne et sous-total calculés à la construction. Chaque total de ligne
+    est arrondi au centime (demi vers le haut) ; le sous-total est la somme de ces totaux
+    arrondis et la TVA est arrondie une fois, sur le sous-total.
+    """
+    __slots__ = ("keys", "labels", "units", "qty_c", "price_c", "total_c", "subtotal_c")
+
+    def __init__(self, lines):
+        self.keys = [ln.get("key", "") for ln in lines]
+        self.labels = [ln["label"] for ln in lines]
+        self.units = [ln["unit"] for ln in lines]
+        self.qty_c = array("q", [to_cents(ln["qty"]) for ln in lines])
+        self.price_c = array("q", [to_cents(ln["unit_price"]) for ln in lines])
+        # qté (1/100) × PU (centimes) → centimes × 100
+        self.total_c = array("q", [_div_round(q * p, 100) for q, p in zip(self.qty_c, self.price_c)])
+        self.subtotal_c = sum(self.total_c)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def totals_c(self, tva_rate):
+        tva_c = _div_round(self.subtotal_c * to_cents(tva_rate), 10000)
+        return self.subtotal_c, tva_c, self.subtotal_c + tva_c
+
+    def rows(self):
+        """(libellé, qté, unité, PU, total ligne) en euros, pour l'affichage."""
+        for label, unit, q, p, t in zip(self.labels, self.units, self.qty_c, self.price_c, self.total_c):
+            yield label, q / 100, unit, p / 100, t / 100
+
+def quote_lines(lines):
+    return lines if isinstance(lines, QuoteLines) else QuoteLines(lines)
+
+@timed_stage("totals")
+def compute_totals(lines, tva_rate):
+    """(sous-total, TVA, total TTC) en euros ; `lines` : liste de lignes ou QuoteLines."""
+    return tuple(c / 100 for c in quote_lines(lines).totals_c(tva_rate))
@@ -0,0 +1,109 @@
+"""
+Instrumentation optionnelle du pipeline : compteurs par règle de détection
+(évaluations, déclenchements, temps, origine de la quantité) et temps par étape.
+
+Désactivée par défaut : le moteur ne teste alors qu'un booléen par appel. Les compteurs
+sont communs au processus (toutes les sessions d'un serveur) : DEVIS_METRICS=1 les active
+au lancement. Instrumentée, l'extraction se passe du mémo par membre de phrase pour
+mesurer chaque règle : à réserver au diagnostic.
+    from devis.metrics import METRICS
+    METRICS.enable(); ...; print(METRICS.to_prometheus())
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+class PipelineMetrics:
+    def __init__(self):
+        self.enabled = os.environ.get("DEVIS_METRICS") == "1"
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.rules = {}   # clé -> {"evaluated", "matches", "ns", "qty_sources": {origine: n}}
+            self.stages = {}  # étape -> {"calls", "ns"}
+
+    def record_rule(self, key, ns, matched, qty_source=None):
+        with self._lock:
+            r = self.rules.get(key)
+            if r is None:
+                r = self.rules[key] = {"evaluated": 0, "matches": 0, "ns": 0, "qty_sources": {}}
+            r["evaluated"] += 1
+            r["ns"] += ns
+            if matched:
+                r["matches"] += 1
+                r["qty_sources"][qty_source] = r["qty_sources"].get(qty_source, 0) + 1
+
+    def record_stage(self, name, ns):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = {"calls": 0, "ns": 0}
+            s["calls"] += 1
+            s["ns"] += ns
+
+    def dead_rules(self, all_keys):
+        """Règles jamais déclenchées depuis le dernier reset (évaluées ou non)."""
+        return [k for k in all_keys if not self.rules.get(k, {}).get("matches")]
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "rules": {k: dict(v, qty_sources=dict(v["qty_sources"])) for k, v in self.rules.items()},
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+            }
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        out = []
+
+        def metric(name, kind, help_, samples):
+            out.append(f"# HELP {name} {help_}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(f"{name}{{{labels}}} {value}" for labels, value in samples)
+
+        rules = sorted(data["rules"].items())
+        metric("devis_rule_evaluations_total", "counter", "Règles évaluées (passé le filtre par mots-ancres).",
+               [(f'rule="{k}"', v["evaluated"]) for k, v in rules])
+        metric("devis_rule_matches_total", "counter", "Règles déclenchées.",
+               [(f'rule="{k}"', v["matches"]) for k, v in rules])
+        metric("devis_rule_seconds_total", "counter", "Temps passé à évaluer chaque règle.",
+               [(f'rule="{k}"', v["ns"] / 1e9) for k, v in rules])
+        metric("devis_rule_qty_source_total", "counter", "Origine de la quantité des lignes détectées.",
+               [(f'rule="{k}",source="{src}"', n) for k, v in rules for src, n in sorted(v["qty_sources"].items())])
+        stages = sorted(data["stages"].items())
+        metric("devis_stage_calls_total", "counter", "Appels par étape du pipeline.",
+               [(f'stage="{k}"', v["calls"]) for k, v in stages])
+        metric("devis_stage_seconds_total", "counter", "Temps cumulé par étape du pipeline.",
+               [(f'stage="{k}"', v["ns"] / 1e9) for k, v in stages])
+        return "\n".join(out) + "\n"
+
+METRICS = PipelineMetrics()
+
+def timed_stage(name):
+    """Décorateur : chronomètre l'étape `name` quand l'instrumentation est active."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.record_stage(name, time.perf_counter_ns() - t0)
+        return wrapper
+    return deco
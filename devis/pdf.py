@@ -0,0 +1,158 @@
+"""Rendu PDF du devis (ReportLab n'est importé qu'avec ce module)."""
+import io
+from functools import lru_cache
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.units import cm
+
+from .lines import quote_lines
+from .metrics import timed_stage
+
+# Les parties fixes (en-tête société, en-tête de tableau) sont dessinées une seule
+# fois par document sous forme de XObjects ReportLab, puis réutilisées sur chaque page.
+
+PAGE_W, PAGE_H = A4
+X_MARGIN = 2 * cm
+TOP = PAGE_H - 2 * cm
+BOTTOM = 2 * cm
+COL_QTY = X_MARGIN + 10 * cm
+COL_PU = X_MARGIN + 13 * cm
+COL_TOTAL = PAGE_W - X_MARGIN
+LABEL_MAX_W = 7.8 * cm
+ROW_H = 12
+HEADER_H = 14 + 12 + 20  # hauteur de l'en-tête société
+
+@lru_cache(maxsize=4096)
+def _text_width(text, font="Helvetica", size=10):
+    return pdfmetrics.stringWidth(text, font, size)
+
+@lru_cache(maxsize=1024)
+def _wrap(text, max_width, font="Helvetica", size=10):
+    """Coupe `text` en lignes de largeur <= max_width (mot par mot, largeurs mesurées en cache)."""
+    rows, cur = [], ""
+    for word in text.split():
+        cand = f"{cur} {word}" if cur else word
+        if cur and _text_width(cand, font, size) > max_width:
+            rows.append(cur)
+            cur = word
+        else:
+            cur = cand
+    rows.append(cur)
+    return tuple(rows)
+
+def _define_forms(c, company):
+    # En-tête société (haut de chaque page)
+    c.beginForm("devis_header")
+    y = TOP
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(X_MARGIN, y, company.get("name", "FactureIA"))
+    c.setFont("Helvetica", 10); y -= 14
+    c.drawString(X_MARGIN, y, company.get("addr", "Adresse"))
+    y -= 12; c.drawString(X_MARGIN, y, company.get("siret", "SIRET: "))
+    c.endForm()
+
+    # En-tête de tableau, dessiné à y=0 puis translaté ; la boîte du XObject descend sous le
+    # trait de -ROW_H, sinon le lecteur la rogne (trait et jambages des lettres)
+    c.beginForm("devis_table_header", lowery=-ROW_H - 2, uppery=ROW_H)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(X_MARGIN, 0, "Désignation")
+    c.drawString(X_MARGIN + 9*cm, 0, "Qté")
+    c.drawString(X_MARGIN + 11*cm, 0, "PU")
+    c.drawString(X_MARGIN + 14*cm, 0, "Total")
+    c.line(X_MARGIN, -ROW_H, COL_TOTAL, -ROW_H)
+    c.endForm()
+
+
+def _table_header(c, y):
+    c.saveState()
+    c.translate(0, y)
+    c.doForm("devis_table_header")
+    c.restoreState()
+    return y - ROW_H - 6
+
+def _new_page(c, t):
+    """Termine la page (texte accumulé dans `t`) et en ouvre une nouvelle avec l'en-tête société."""
+    c.drawText(t)
+    c.showPage()
+    c.doForm("devis_header")
+    return TOP - HEADER_H, c.beginText()
+
+def _right(t, x, y, s, font="Helvetica", size=10):
+    t.setTextOrigin(x - _text_width(s, font, size), y)
+    t.textOut(s)
+
+def _left(t, x, y, s):
+    t.setTextOrigin(x, y)
+    t.textOut(s)
+
+@timed_stage("pdf")
+def make_pdf_devis(company, client, devis_num, date_str, lines, tva_rate, subtotal, tva, total, conditions, out=None):
+    """
+    Rend le devis en PDF (`lines` : liste de lignes ou QuoteLines déjà calculé).
+    `out` peut être un chemin ou un flux binaire ouvert ;
+    par défaut un BytesIO est créé, rembobiné et renvoyé.
+    Tout le texte d'une page passe par un seul objet texte (au lieu d'un par chaîne).
+    """
+    buf = io.BytesIO() if out is None else out
+    # flux compressés pour ce document ; la configuration globale de ReportLab (ASCII85) n'est pas touchée
+    c = canvas.Canvas(buf, pagesize=A4, pageCompression=1)
+    _define_forms(c, company)
+    c.doForm("devis_header")
+    y = TOP - HEADER_H
+    t = c.beginText()
+
+    # Client / devis
+    t.setFont("Helvetica-Bold", 12)
+    _left(t, X_MARGIN, y, f"DEVIS n° {devis_num}")
+    y -= 14; t.setFont("Helvetica", 10)
+    _left(t, X_MARGIN, y, f"Date : {date_str}")
+    y -= 12; _left(t, X_MARGIN, y, f"Client : {client.get('name','')}")
+    y -= 12
+    if client.get("addr"):
+        _left(t, X_MARGIN, y, f"Adresse : {client['addr']}"); y -= 12
+    y -= 8
+
+    y = _table_header(c, y)
+
+    # Lines (libellés longs sur plusieurs lignes, en-tête de colonnes répété à chaque page)
+    for label, qty, unit, unit_price, line_total in quote_lines(lines).rows():
+        rows = _wrap(label, LABEL_MAX_W)
+        if y - ROW_H * len(rows) < BOTTOM:
+            y, t = _new_page(c, t)
+            y = _table_header(c, y)
+            t.setFont("Helvetica", 10)
+        _left(t, X_MARGIN, y, rows[0])
+        _right(t, COL_QTY, y, f"{qty:.2f} {unit}")
+        _right(t, COL_PU, y, f"{unit_price:.2f} €")
+        _right(t, COL_TOTAL, y, f"{line_total:.2f} €")
+        for row in rows[1:]:
+            y -= ROW_H
+            _left(t, X_MARGIN, y, row)
+        y -= ROW_H
+
+    # Totals
+    if y - 10 - 14 - 2 * ROW_H < BOTTOM:
+        y, t = _new_page(c, t)
+    y -= 10; c.line(X_MARGIN, y, COL_TOTAL, y); y -= 14
+    bold = ("Helvetica-Bold", 10)
+    t.setFont(*bold)
+    for label, amount in (("Sous-total :", subtotal), (f"TVA ({tva_rate:.0f}%) :", tva), ("Total TTC :", total)):
+        _right(t, COL_PU, y, label, *bold)
+        _right(t, COL_TOTAL, y, f"{amount:.2f} €", *bold)
+        y -= 12
+    y += 12
+
+    # Footer
+    y -= 24; t.setFont("Helvetica", 9)
+    for row in (_wrap(conditions, COL_TOTAL - X_MARGIN, "Helvetica", 9) if conditions else ()):
+        if y < BOTTOM:
+            y, t = _new_page(c, t)
+            t.setFont("Helvetica", 9)
+        _left(t, X_MARGIN, y, row); y -= 12
+
+    c.drawText(t)
+    c.save()
+    if out is None:
+        buf.seek(0)
+    return buf
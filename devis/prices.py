@@ -0,0 +1,110 @@
+"""
+Catalogue des prix par métier, chargé à la demande depuis catalog/<métier>.json
+(à la racine du dépôt).
+
+Chaque fichier porte une version et ses postes ; il n'est lu qu'au premier accès au
+métier puis indexé (par clé, par unité, par préfixe de libellé). Un fichier modifié
+sur disque est rechargé au prochain accès, sans redémarrer l'app ; illisible (en cours
+d'écriture), il est ignoré et le dernier catalogue lu reste servi jusqu'au suivant.
+"""
+import bisect
+import json
+import os
+import time
+from collections.abc import Mapping
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "catalog")
+TRADES = ("couvreur", "maconnerie", "placo", "elagage", "carreleur")
+RELOAD_CHECK_S = 1.0  # au plus un stat() par métier et par seconde
+
+_FOLD = str.maketrans("éèêëàâäîïôöûüùç", "eeeeaaaiioouuuc")
+
+def fold(s):
+    return s.lower().translate(_FOLD)
+
+class TradeCatalog:
+    """Postes d'un métier, indexés une fois au chargement."""
+
+    def __init__(self, trade, version, items, rules=(), keywords=()):
+        self.trade = trade
+        self.version = version
+        self.items = items
+        self.keywords = keywords  # mots qui signalent le métier dans une demande (devis.router)
+        self.rules = rules  # règles métier déclarées dans le fichier (devis.rules)
+        self.compiled_rules = None  # compilées au premier usage
+        self.stamp = None  # mtime du fichier chargé, pour invalider les caches en aval
+        self.fuzzy_index = None  # index de trigrammes (devis.fuzzy), construit au premier usage
+        self.by_unit = {}
+        for key, cfg in items.items():
+            self.by_unit.setdefault(cfg["unit"], []).append(key)
+        # clés triées par libellé (sans accents) → options du multiselect et recherche par préfixe
+        self.keys_by_label = sorted(items, key=lambda k: fold(items[k]["label"]))
+        self._folded_labels = [fold(items[k]["label"]) for k in self.keys_by_label]
+
+    def __getitem__(self, key):
+        return self.items[key]
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def with_unit(self, unit):
+        return self.by_unit.get(unit, [])
+
+    def label_prefix(self, prefix):
+        """Clés dont le libellé commence par `prefix` (insensible à la casse et aux accents)."""
+        p = fold(prefix)
+        i = bisect.bisect_left(self._folded_labels, p)
+        j = bisect.bisect_left(self._folded_labels, p + "\uffff", i)
+        return self.keys_by_label[i:j]
+
+def load_catalog_file(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return TradeCatalog(data["trade"], data.get("version", ""), data.get("items", {}),
+                        data.get("rules", []), data.get("keywords", []))
+
+_loaded = {}  # métier -> (mtime_ns, dernier contrôle, TradeCatalog)
+
+def catalog(trade):
+    """Catalogue du métier, chargé au premier appel et rechargé si le fichier a changé."""
+    now = time.monotonic()
+    hit = _loaded.get(trade)
+    if hit is not None and now - hit[1] < RELOAD_CHECK_S:
+        return hit[2]
+    path = os.path.join(CATALOG_DIR, f"{trade}.json")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise KeyError(trade) from None
+    if hit is not None and hit[0] == mtime:
+        cat = hit[2]
+    else:
+        try:
+            cat = load_catalog_file(path)
+        except (ValueError, KeyError):
+            if hit is None:
+                raise
+            # fichier en cours d'écriture ou invalide : on garde le dernier catalogue lu,
+            # sans retenir la nouvelle date, pour relire le fichier au prochain contrôle
+            cat, mtime = hit[2], hit[0]
+        else:
+            cat.stamp = mtime
+    _loaded[trade] = (mtime, now, cat)
+    return cat
+
+class _Prices(Mapping):
+    """Vue {métier: {clé: poste}} compatible avec l'ancien dict PRICES, chargée paresseusement."""
+
+    def __getitem__(self, trade):
+        return catalog(trade).items
+
+    def __iter__(self):
+        return (t for t in TRADES if os.path.exists(os.path.join(CATALOG_DIR, f"{t}.json")))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+PRICES = _Prices()
@@ -0,0 +1,119 @@
+"""Quantités d'un texte libre : index (unité, position, membre de phrase) et plus proche voisin."""
+import re
+import bisect
+
+FRENCH_QTY_WORDS = {"quinzaine":15,"douzaine":12,"dizaine":10,"quinze":15,"douze":12,"dix":10,"vingt":20}
+
+def num(s):
+    try: return float(s.replace(",", "."))
+    except: return None
+
+def qty_from_words(w):
+    return float(FRENCH_QTY_WORDS.get(w.lower().strip(), 0))
+
+# --- Index des quantités (une seule passe sur le texte) ---
+# Chaque quantité est classée dans une seule unité : "120 m²" est une surface,
+# jamais un ml, et "3 maisons" n'est plus lu comme 3 ml.
+_QTY_TOKEN = re.compile(
+    r"(?P<num>\d+(?:[,.]\d+)?)\s*(?:"
+    r"(?P<m2>m2|m²|m\^2|m(?:è|e)tres?\s*carr(?:é|e)s?)"
+    r"|(?P<ml>ml\b|m(?:è|e)tres?(?:\s*lin(?:é|e)aires?)?\b|m\b)"
+    r"|(?P<u>u\b|unit(?:é|e)s?|tuiles?|chevrons?)"
+    r")"
+    r"|\b(?P<word>" + "|".join(sorted(FRENCH_QTY_WORDS, key=len, reverse=True)) + r")\s+(?:de\s+)?(?:tuiles?|chevrons?)"
+)
+# Séparateurs de membres de phrase ("noue 6 ml, solin 8 ml") ; "2,5" n'en est pas un.
+_CLAUSE_SEP = re.compile(r"[;\n+]|[,.](?!\d)|\bpuis\b")
+
+def split_clauses(text):
+    """Membres de phrase du texte : (positions des séparateurs, [(début, fin), ...])."""
+    seps, spans, start = [], [], 0
+    for m in _CLAUSE_SEP.finditer(text):
+        seps.append(m.start())
+        spans.append((start, m.start()))
+        start = m.end()
+    spans.append((start, len(text)))
+    return seps, spans
+
+def scan_quantities(text):
+    """Quantités du texte dans l'ordre : ((unité, début, fin, valeur), ...)."""
+    found = []
+    for m in _QTY_TOKEN.finditer(text):
+        if m.group("word"):
+            unit, value = "u", qty_from_words(m.group("word"))
+        else:
+            unit = "m2" if m.group("m2") else "ml" if m.group("ml") else "u"
+            value = num(m.group("num"))
+        found.append((unit, m.start(), m.end(), value))
+    return tuple(found)
+
+def index_from_clauses(seps, pieces):
+    """
+    Index des quantités reconstitué à partir des membres de phrase : `pieces` donne,
+    pour chaque membre dans l'ordre, (position de début, scan_quantities(membre)).
+    """
+    by_unit = {}
+    for clause, (offset, found) in enumerate(pieces):
+        for unit, start, end, value in found:
+            starts, entries = by_unit.setdefault(unit, ([], []))
+            starts.append(offset + start)
+            entries.append((offset + start, offset + end, value, clause))
+    return seps, by_unit
+
+def index_quantities(text):
+    """
+    Relève en une passe toutes les quantités du texte.
+    Renvoie (positions des séparateurs, {unité: (débuts, [(début, fin, valeur, membre), ...])}),
+    trié par position ; `membre` est le numéro du membre de phrase de la quantité.
+    """
+    seps = [m.start() for m in _CLAUSE_SEP.finditer(text)]
+    by_unit = {}
+    for unit, start, end, value in scan_quantities(text):
+        starts, entries = by_unit.setdefault(unit, ([], []))
+        starts.append(start)
+        entries.append((start, end, value, bisect.bisect_right(seps, start)))
+    return seps, by_unit
+
+def nearest_qty(qidx, unit_kind, start, end):
+    """
+    Quantité de l'unité demandée la plus proche de la plage [start, end).
+    On préfère une quantité du même membre de phrase, puis la plus proche, puis celle qui suit.
+    """
+    return nearest_qty_source(qidx, unit_kind, start, end)[0]
+
+def nearest_qty_source(qidx, unit_kind, start, end):
+    """Comme nearest_qty, mais renvoie (quantité, origine) : forfait, aucune, meme_membre ou autre_membre."""
+    if unit_kind == "forfait":
+        return 1.0, "forfait"
+    seps, by_unit = qidx
+    if unit_kind not in by_unit:
+        return 0.0, "aucune"
+    starts, entries = by_unit[unit_kind]
+    first_clause = bisect.bisect_right(seps, start)
+    last_clause = bisect.bisect_right(seps, max(start, end - 1))
+    i = bisect.bisect_left(starts, start)
+    k = bisect.bisect_left(starts, end, i)
+    # candidats : dernière quantité avant la plage, première dedans, première après
+    best, best_rank = 0.0, (True, float("inf"), True)
+    for j in (i - 1, i, k):
+        if 0 <= j < len(entries):
+            q_start, q_end, value, clause = entries[j]
+            if q_start >= end:
+                dist = q_start - end
+            elif q_end <= start:
+                dist = start - q_end
+            else:
+                dist = 0
+            rank = (not first_clause <= clause <= last_clause, dist, q_start < end)
+            if rank < best_rank:
+                best, best_rank = value, rank
+    return best, "autre_membre" if best_rank[0] else "meme_membre"
+
+def find_qty(text, unit_kind):
+    """
+    unit_kind in {"ml","m2","u","forfait"} — première quantité trouvée pour cette unité.
+    """
+    if unit_kind == "forfait":
+        return 1.0  # forfait par défaut
+    entries = index_quantities(text)[1].get(unit_kind)
+    return entries[1][0][2] if entries else 0.0
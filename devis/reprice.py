@@ -0,0 +1,148 @@
+"""
+Réévaluation en masse de devis (historique ou JSONL) contre une version de la grille de prix.
+
+Une grille est un jeu de fichiers catalog/<métier>.json, prix et règles métier compris.
+Pour chaque devis :
+
+1. les lignes ajoutées par les règles (marquées "rule") sont retirées ;
+2. chaque poste du catalogue reprend le PU de la grille, sauf si son PU n'est pas celui du
+   catalogue au moment du chiffrage ("catalog_price", noté par QuoteHistory.save ; à
+   défaut, celui de la grille précédente) : c'est un PU saisi à la main dans le sélecteur
+   de postes ; les lignes manuelles gardent le leur ;
+3. les règles de la grille sont réappliquées ;
+4. les totaux sont recalculés.
+
+Les métiers absents de la grille ne sont pas touchés. Les devis sont traités par
+paquets, ce qui borne la mémoire. Dans un paquet, les montants de toutes les lignes
+sont calculés en un seul passage sur des colonnes (array 'q'), en centimes entiers
+comme QuoteLines : les arrondis sont ceux de l'app et du PDF.
+"""
+import itertools
+import os
+from array import array
+
+from .lines import _div_round, to_cents
+from .prices import CATALOG_DIR, TRADES, load_catalog_file
+from .rules import CompiledRules, apply_compiled
+
+CHUNK_SIZE = 2000
+
+class PriceTable:
+    """
+    Version de la grille : PU par (métier, clé) et règles compilées par métier.
+    `previous` : grille avec laquelle ont été chiffrés les devis dont les lignes ne portent pas
+    leur "catalog_price" (enregistrés avant lui, ou JSONL). Sans elle, une telle ligne est une
+    erreur : on ne peut pas savoir si son PU a été saisi à la main.
+    """
+
+    def __init__(self, catalogs, previous=None):
+        self.previous = previous
+        self.catalogs = {cat.trade: cat for cat in catalogs}
+        self.version = " ".join(f"{t}@{cat.version}" for t, cat in self.catalogs.items())
+        self.rules = {t: CompiledRules(cat) for t, cat in self.catalogs.items()}
+        # libellés des lignes ajoutées par les règles, pour les devis enregistrés avant leur marque "rule"
+        self.rule_labels = {t: {ln["label"] for _, ln in (*r.head, *r.tail)} for t, r in self.rules.items()}
+        self.prices = {}  # (métier, clé) -> PU
+        self.owner = {}   # clé -> premier métier qui la déclare, pour les lignes sans métier
+        for t, cat in self.catalogs.items():
+            for key, cfg in cat.items.items():
+                self.prices[t, key] = cfg["unit_price"]
+                self.owner.setdefault(key, t)
+
+    @classmethod
+    def load(cls, paths=(CATALOG_DIR,), previous=None):
+        """Grille lue depuis des fichiers <métier>.json et/ou des dossiers qui en contiennent."""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files += [f for f in (os.path.join(path, f"{t}.json") for t in TRADES) if os.path.exists(f)]
+            else:
+                files.append(path)
+        return cls((load_catalog_file(f) for f in files), previous)
+
+    def trade_of(self, ln, metier):
+        trade = ln.get("metier") or metier
+        key = ln.get("key")
+        if (trade, key) not in self.prices and key in self.owner:
+            trade = self.owner[key]
+        return trade
+
+    def reprice_line(self, ln, metier):
+        """
+        La ligne au PU de la grille (copie, "catalog_price" compris), ou telle quelle si ce n'est
+        pas un poste de la grille ou si son PU a été saisi à la main (différent du PU du catalogue
+        au chiffrage). ValueError si ce PU d'origine est inconnu.
+        """
+        slot = (self.trade_of(ln, metier), ln.get("key"))
+        price = self.prices.get(slot)
+        if price is None:
+            return ln
+        if "catalog_price" in ln:
+            listed = ln["catalog_price"]
+        elif self.previous is not None:
+            listed = self.previous.prices.get(slot)
+        else:
+            raise ValueError(f"{ln['label']} : PU du catalogue au chiffrage inconnu (donner la grille précédente)")
+        if listed != ln["unit_price"] or price == ln["unit_price"]:
+            return ln
+        return {**ln, "unit_price": price, "catalog_price": price}
+
+    def reprice(self, rec):
+        """Lignes du devis `rec` (métier, lignes après règles, en-tête) recalculées ; `rec` n'est pas modifié."""
+        metier = rec["metier"]
+        options = {"grosse_cheminee": bool(rec.get("header", {}).get("grosse_cheminee"))}
+        groups = {metier: []}
+        for ln in rec["lines"]:
+            trade = self.trade_of(ln, metier)
+            if ln.get("rule") or (not ln.get("key") and ln["label"] in self.rule_labels.get(trade, ())):
+                continue  # ligne ajoutée par une règle : remise par les règles de la grille si leur condition tient
+            groups.setdefault(trade, []).append(self.reprice_line(ln, metier))
+        out = []
+        for trade, part in groups.items():
+            rules = self.rules.get(trade)
+            out.extend(apply_compiled(rules, part, **options) if rules else part)
+        return out
+
+def chunk_totals(quotes, tva_rates):
+    """(sous-total, TVA, TTC) en centimes de chaque devis d'un paquet, en un passage sur toutes leurs lignes."""
+    qty_c = array("q", [to_cents(ln["qty"]) for lines in quotes for ln in lines])
+    price_c = array("q", [to_cents(ln["unit_price"]) for lines in quotes for ln in lines])
+    line_c = array("q", [_div_round(q * p, 100) for q, p in zip(qty_c, price_c)])
+    totals, start = [], 0
+    for end, rate in zip(itertools.accumulate(len(lines) for lines in quotes), tva_rates):
+        subtotal_c = sum(line_c[start:end])
+        tva_c = _div_round(subtotal_c * to_cents(rate), 10000)
+        totals.append((subtotal_c, tva_c, subtotal_c + tva_c))
+        start = end
+    return totals
+
+def tva_of(rec, default):
+    return float(rec.get("tva_rate", rec.get("tva", default)))
+
+def reprice_records(records, table, tva_default, chunk_size=CHUNK_SIZE):
+    """
+    Réévalue les devis par paquets de `chunk_size`. Génère, pour chaque devis, dans l'ordre :
+    (devis, lignes recalculées, anciens totaux, nouveaux totaux, erreur), totaux en centimes.
+    Un devis illisible (clé "_error", champ manquant) ressort avec son erreur et sans lignes.
+    """
+    it = iter(records)
+    while chunk := list(itertools.islice(it, chunk_size)):
+        ok, errors = [], {}
+        for i, rec in enumerate(chunk):
+            try:
+                if "_error" in rec:
+                    raise ValueError(rec["_error"])
+                for ln in rec["lines"]:  # montants lisibles (mémorisés : le calcul en colonnes ne les refait pas)
+                    to_cents(ln["qty"]), to_cents(ln["unit_price"])
+                ok.append((i, rec["lines"], table.reprice(rec), tva_of(rec, tva_default)))
+            except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+                errors[i] = f"{type(e).__name__}: {e}"
+        rates = [rate for *_, rate in ok]
+        old = iter(chunk_totals([lines for _, lines, _, _ in ok], rates))
+        new = iter(chunk_totals([lines for _, _, lines, _ in ok], rates))
+        repriced = iter(lines for _, _, lines, _ in ok)
+        for i, rec in enumerate(chunk):
+            if i in errors:
+                yield rec, None, None, None, errors[i]
+            else:
+                yield rec, next(repriced), next(old), next(new), None
@@ -0,0 +1,135 @@
+"""
+Aiguillage multi-métiers : quels métiers une demande concerne-t-elle ?
+
+Un index mot → {métier: poids} est construit depuis les catalogues : mots-clés
+déclarés ("keywords", poids fort, dès 3 lettres : « mur ») et mots des libellés et
+synonymes (poids faible, 4 lettres ou plus).
+Un mot présent dans plusieurs métiers compte moins. Noter une demande ne coûte
+qu'une lecture de ses mots ; seuls les extracteurs des métiers retenus sont lancés,
+en parallèle s'il y en a plusieurs, et leurs lignes sont fusionnées en un seul devis.
+"""
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .extract import extract_couvreur_from_text_advanced, extract_from_catalog
+from .prices import TRADES, catalog, fold
+from .rules import apply_business_rules
+
+ROUTE_MIN_SCORE = 1.0
+KEYWORD_WEIGHT = 1.0
+LABEL_WORD_WEIGHT = 0.5
+KEYWORD_MIN_LEN = 3  # les mots-clés sont choisis : un mot court y est voulu
+LABEL_WORD_MIN_LEN = 4
+
+# métiers dotés d'une table de règles dédiée ; les autres passent par leur catalogue
+EXTRACTORS = {"couvreur": extract_couvreur_from_text_advanced}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("avec pour dans sans sous plus chez tout tous faire refaire".split())
+
+def _words(text, min_len=LABEL_WORD_MIN_LEN):
+    for w in _WORD.findall(fold(text)):
+        if len(w) < min_len or w.isdigit() or w in _STOPWORDS:
+            continue
+        yield w[:-1] if w[-1] in "sx" and len(w) > 4 else w  # pluriel → singulier
+
+class TradeRouter:
+    """Index mot → {métier: poids}, construit pour un jeu de versions de catalogues."""
+
+    def __init__(self, catalogs):
+        raw = {}  # mot -> {métier: poids avant pondération}
+        for cat in catalogs:
+            for kw in cat.keywords:
+                for w in _words(kw, KEYWORD_MIN_LEN):
+                    raw.setdefault(w, {})[cat.trade] = KEYWORD_WEIGHT
+            for cfg in cat.items.values():
+                for text in (cfg["label"], *cfg.get("synonyms", ())):
+                    for w in _words(text):
+                        per = raw.setdefault(w, {})
+                        per[cat.trade] = max(per.get(cat.trade, 0.0), LABEL_WORD_WEIGHT)
+        # un mot commun à n métiers vaut 1/n de son poids pour chacun
+        self.index = {w: {t: wt / len(per) for t, wt in per.items()} for w, per in raw.items()}
+
+    def scores(self, text):
+        """{métier: score} pour les métiers évoqués par le texte (chaque mot compte une fois)."""
+        scores = {}
+        index = self.index
+        # mots de 3 lettres lus aussi : seuls les mots-clés courts en ont dans l'index
+        for w in set(_words(text, KEYWORD_MIN_LEN)):
+            per = index.get(w)
+            if per is None and len(w) == KEYWORD_MIN_LEN + 1 and w[-1] in "sx":
+                per = index.get(w[:-1])  # pluriel d'un mot-clé court (« murs »)
+            if per:
+                for trade, weight in per.items():
+                    scores[trade] = scores.get(trade, 0.0) + weight
+        return scores
+
+_router = None  # (versions des catalogues, TradeRouter)
+_router_lock = threading.Lock()
+_pool = None
+
+def trade_router():
+    """Routeur à jour des catalogues (reconstruit si l'un d'eux a été rechargé)."""
+    global _router
+    cats = []
+    for trade in TRADES:
+        try:
+            cats.append(catalog(trade))
+        except KeyError:
+            continue
+    stamps = tuple((c.trade, c.stamp) for c in cats)
+    with _router_lock:
+        if _router is None or _router[0] != stamps:
+            _router = (stamps, TradeRouter(cats))
+        return _router[1]
+
+def route(text, min_score=ROUTE_MIN_SCORE):
+    """Métiers retenus pour le texte, du plus au moins évoqué : [(métier, score)]."""
+    scores = trade_router().scores(text)
+    return sorted(((t, s) for t, s in scores.items() if s >= min_score), key=lambda ts: -ts[1])
+
+def extract_trade(trade, text):
+    """Lignes détectées pour un métier, chacune marquée de son métier."""
+    extractor = EXTRACTORS.get(trade)
+    lines = extractor(text) if extractor else extract_from_catalog(trade, text)
+    for ln in lines:
+        ln["metier"] = trade
+    return lines
+
+def _extract_pool():
+    global _pool
+    with _router_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=len(TRADES), thread_name_prefix="extract")
+        return _pool
+
+def extract_multi(text, default_trade=None, trades=None):
+    """
+    Lignes détectées pour les métiers retenus (`trades`, sinon route(text)), fusionnées
+    dans l'ordre des métiers. Sans métier reconnu, `default_trade` est utilisé s'il est donné.
+    Renvoie (lignes, [(métier, score)]).
+    """
+    routed = route(text) if trades is None else [(t, None) for t in trades]
+    if not routed and default_trade:
+        routed = [(default_trade, None)]
+    if len(routed) <= 1:  # cas courant : pas de thread pour un seul métier
+        parts = [extract_trade(t, text) for t, _ in routed]
+    else:
+        futures = [_extract_pool().submit(extract_trade, t, text) for t, _ in routed]
+        parts = [f.result() for f in futures]
+    return [ln for part in parts for ln in part], routed
+
+def apply_rules_by_trade(lines, default_trade, grosse_cheminee=False, **options):
+    """
+    Règles métier appliquées séparément aux lignes de chaque métier (clé "metier" de la
+    ligne, sinon `default_trade`), puis regroupées : d'abord le métier par défaut, ensuite
+    les autres dans l'ordre de leur première ligne.
+    """
+    groups = {default_trade: []}
+    for ln in lines:
+        groups.setdefault(ln.get("metier", default_trade), []).append(ln)
+    out = []
+    for trade, part in groups.items():
+        out.extend(apply_business_rules(trade, part, grosse_cheminee=grosse_cheminee, **options))
+    return out
@@ -0,0 +1,113 @@
+"""
+Règles métier appliquées aux lignes détectées ou saisies.
+
+Les règles sont des données, déclarées par métier dans catalog/<métier>.json :
+
+    {"add_line": {"label": ..., "qty": 1, "unit": "forfait", "unit_price": 0.0}, "position": "first"}
+    {"target": "<clé>", "set": {"unit_price": 0.0}, "if_any_group": "Nettoyage toiture"}
+    {"target": "<clé>", "set": {"unit_price": 800.0}, "if_option": "grosse_cheminee"}
+
+Conditions (facultatives, une par règle) : "if_any_key" (liste de clés), "if_any_group"
+(groupe du catalogue) ou "if_option" (option passée à apply_business_rules).
+Elles sont compilées une fois par version du catalogue en un index clé → conditions
+satisfaites / modifications visées, puis appliquées en un seul passage sur les lignes :
+le coût suit le nombre de lignes, pas le nombre de règles × lignes.
+"""
+from .metrics import timed_stage
+from .prices import catalog
+
+_CONDITIONS = ("if_any_key", "if_any_group", "if_option")
+
+class CompiledRules:
+    """Règles d'un métier indexées par clé de ligne."""
+    __slots__ = ("by_key", "patches", "options", "head", "tail")
+
+    def __init__(self, cat):
+        self.by_key = {}   # clé -> (conditions satisfaites par sa présence, clé visée par un "set" ?)
+        self.patches = {}  # clé visée -> [(condition ou None, champs à remplacer)], dans l'ordre déclaré
+        self.options = {}  # option -> condition
+        self.head = []     # (condition ou None, ligne ajoutée en tête)
+        self.tail = []     # (condition ou None, ligne ajoutée en fin)
+        key_conds = {}
+        for n, rule in enumerate(cat.rules):
+            cond = self._condition(cat, n, rule, key_conds)
+            if "add_line" in rule:
+                position = rule.get("position", "last")
+                if position not in ("first", "last"):
+                    raise ValueError(f"{cat.trade}: règle {n}, position inconnue {position!r}")
+                # ligne marquée : son métier (devis multi-métiers) et son origine (retirée avant réévaluation)
+                line = {**rule["add_line"], "metier": cat.trade, "rule": True}
+                (self.head if position == "first" else self.tail).append((cond, line))
+            elif "set" in rule:
+                target = rule.get("target")
+                if target not in cat:
+                    raise ValueError(f"{cat.trade}: règle {n}, poste visé inconnu {target!r}")
+                self.patches.setdefault(target, []).append((cond, dict(rule["set"])))
+            else:
+                raise ValueError(f"{cat.trade}: règle {n} sans action (add_line ou set)")
+        for key in key_conds.keys() | self.patches.keys():
+            self.by_key[key] = (tuple(key_conds.get(key, ())), key in self.patches)
+
+    def _condition(self, cat, n, rule, key_conds):
+        given = [c for c in _CONDITIONS if c in rule]
+        if not given:
+            return None
+        if len(given) > 1:
+            raise ValueError(f"{cat.trade}: règle {n}, une seule condition par règle ({', '.join(given)})")
+        kind, arg = given[0], rule[given[0]]
+        if kind == "if_option":
+            return self.options.setdefault(arg, ("option", arg))
+        if kind == "if_any_group":
+            keys = [k for k, cfg in cat.items.items() if cfg.get("group") == arg]
+        else:
+            keys = list(arg)
+        if not keys:
+            raise ValueError(f"{cat.trade}: règle {n}, aucun poste pour {kind}={arg!r}")
+        cond = (kind, n)
+        for k in keys:
+            key_conds.setdefault(k, []).append(cond)
+        return cond
+
+def compiled_rules(trade):
+    """Règles du métier, compilées une fois par version chargée du catalogue."""
+    cat = catalog(trade)
+    if cat.compiled_rules is None:
+        cat.compiled_rules = CompiledRules(cat)
+    return cat.compiled_rules
+
+@timed_stage("business_rules")
+def apply_business_rules(metier, lines, grosse_cheminee=False, **options):
+    """
+    Nouvelle liste de lignes après règles du métier. Les lignes reçues ne sont jamais
+    modifiées : une ligne visée par une règle est remplacée par une copie.
+    """
+    try:
+        rules = compiled_rules(metier)
+    except KeyError:  # métier sans catalogue
+        return list(lines)
+    return apply_compiled(rules, lines, grosse_cheminee=grosse_cheminee, **options)
+
+def apply_compiled(rules, lines, **options):
+    """Comme apply_business_rules, avec des règles déjà compilées (par ex. d'une autre version du catalogue)."""
+    # un seul passage : conditions satisfaites et positions des lignes visées
+    met = {cond for name, cond in rules.options.items() if options.get(name)}
+    targets = []
+    by_key = rules.by_key
+    for i, ln in enumerate(lines):
+        hit = by_key.get(ln.get("key"))
+        if hit is not None:
+            met.update(hit[0])
+            if hit[1]:
+                targets.append(i)
+
+    out = [dict(ln) for cond, ln in rules.head if cond is None or cond in met]
+    offset = len(out)
+    out.extend(lines)
+    for i in targets:
+        ln = out[offset + i]
+        for cond, patch in rules.patches[ln["key"]]:
+            if cond is None or cond in met:
+                ln = {**ln, **patch}
+        out[offset + i] = ln
+    out.extend(dict(ln) for cond, ln in rules.tail if cond is None or cond in met)
+    return out
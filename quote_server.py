@@ -0,0 +1,255 @@
+"""
+Service HTTP local de devis (asyncio, sans dépendance externe), pour le CRM.
+
+    POST /quote       {"text": "...", "metier": "couvreur", "tva": 10, "grosse_cheminee": false}
+                      → {"lines": [...], "subtotal": ..., "tva": ..., "total": ...}
+    POST /quote.pdf   même corps + "client", "company", "devis_num", "conditions" → PDF
+    GET  /health      → {"ok": true, "in_flight": n, "waiting": n}
+
+L'extraction et le rendu tournent dans un pool de processus (--workers). Au-delà de
+--max-waiting demandes en attente, le service répond 503 + Retry-After au lieu
+d'empiler : c'est au client de réessayer.
+
+    python quote_server.py --port 8765
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from devis import (
+    TRADES, TVA_DEFAULT, CONDITIONS_DEFAULT,
+    extract_couvreur_from_text_advanced, apply_business_rules, QuoteLines,
+)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+PDF_CHUNK = 64 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+# --- Validation (dans la boucle, avant tout travail CPU) ---
+
+def check_request(req):
+    """Demande normalisée ; ValueError (→ 400) pour un champ absent du contrat ou mal typé."""
+    metier = req.get("metier", "couvreur")
+    if metier not in TRADES:  # jamais de nom de fichier arbitraire vers catalog()
+        raise ValueError(f"métier inconnu : {metier!r}")
+    text = req.get("text", "")
+    if not isinstance(text, str):
+        raise ValueError("text : texte attendu")
+    tva = req.get("tva", TVA_DEFAULT)
+    if isinstance(tva, bool) or not isinstance(tva, (int, float, str)):
+        raise ValueError("tva : nombre attendu")
+    try:
+        tva = float(tva)
+    except ValueError:
+        raise ValueError("tva : nombre attendu") from None
+    if not math.isfinite(tva) or not 0 <= tva <= 100:
+        raise ValueError("tva : taux entre 0 et 100 attendu")
+    if not isinstance(req.get("grosse_cheminee", False), bool):  # bool("false") vaudrait True
+        raise ValueError("grosse_cheminee : booléen attendu")
+    client = req.get("client") or {}
+    if not isinstance(client, (str, dict)):
+        raise ValueError("client : texte ou objet attendu")
+    if not isinstance(req.get("company") or {}, dict):
+        raise ValueError("company : objet attendu")
+    for field in ("devis_num", "conditions"):
+        if not isinstance(req.get(field, ""), str):
+            raise ValueError(f"{field} : texte attendu")
+    return dict(req, metier=metier, text=text, tva=tva)
+
+# --- Travail CPU (exécuté dans les processus du pool) ---
+
+def _quote(req):
+    metier = req.get("metier", "couvreur")
+    lines = []
+    if metier == "couvreur" and req.get("text", "").strip():
+        lines = extract_couvreur_from_text_advanced(req["text"])
+    qlines = QuoteLines(apply_business_rules(metier, lines, grosse_cheminee=bool(req.get("grosse_cheminee"))))
+    tva_rate = float(req.get("tva", TVA_DEFAULT))
+    subtotal_c, tva_c, total_c = qlines.totals_c(tva_rate)
+    return qlines, tva_rate, (subtotal_c / 100, tva_c / 100, total_c / 100)
+
+def quote_job(req):
+    qlines, tva_rate, (subtotal, tva, total) = _quote(req)
+    return {
+        "lines": [{"key": k, "label": label, "qty": q, "unit": unit, "unit_price": pu, "total": t}
+                  for k, (label, q, unit, pu, t) in zip(qlines.keys, qlines.rows())],
+        "tva_rate": tva_rate, "subtotal": subtotal, "tva": tva, "total": total,
+    }
+
+def pdf_job(req):
+    from devis.pdf import make_pdf_devis
+    qlines, tva_rate, (subtotal, tva, total) = _quote(req)
+    client = req.get("client") or {}
+    if isinstance(client, str):
+        client = {"name": client}
+    return make_pdf_devis(
+        company=req.get("company") or {},
+        client=client,
+        devis_num=req.get("devis_num") or f"D{date.today().strftime('%Y%m%d')}-001",
+        date_str=date.today().strftime("%d/%m/%Y"),
+        lines=qlines,
+        tva_rate=tva_rate,
+        subtotal=subtotal,
+        tva=tva,
+        total=total,
+        conditions=req.get("conditions", CONDITIONS_DEFAULT),
+    ).getvalue()
+
+# --- HTTP ---
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class QuoteServer:
+    def __init__(self, workers, max_waiting):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.slots = asyncio.Semaphore(workers)  # une tâche CPU par processus à la fois
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def run_cpu(self, fn, req):
+        if self.waiting >= self.max_waiting:
+            raise HttpError(503, "service saturé, réessayer plus tard")
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, req)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 413, {"error": "en-têtes trop longs"}, keep_alive=False)
+                    break
+                keep_alive = await self.dispatch(head, reader, writer)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def dispatch(self, head, reader, writer):
+        try:
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, version = request_line.split(" ", 2)
+            headers = {}
+            for h in header_lines:
+                if ":" in h:
+                    k, v = h.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+        except ValueError:
+            await self.respond(writer, 400, {"error": "requête HTTP invalide"}, keep_alive=False)
+            return False
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        try:
+            try:
+                length = int(headers.get("content-length", "0"))
+            except ValueError:
+                length = -1
+            if length < 0:
+                keep_alive = False  # corps illisible : la suite du flux n'est plus fiable
+                raise HttpError(400, "Content-Length invalide")
+            if length > MAX_BODY_BYTES:
+                keep_alive = False  # corps non lu : il serait pris pour la requête suivante
+                raise HttpError(413, "corps trop volumineux")
+            body = await reader.readexactly(length) if length else b""
+            if path == "/health":
+                await self.respond(writer, 200, {"ok": True, "in_flight": self.in_flight, "waiting": self.waiting}, keep_alive)
+                return keep_alive
+            if path not in ("/quote", "/quote.pdf"):
+                raise HttpError(404, "route inconnue")
+            if method != "POST":
+                raise HttpError(405, "POST attendu")
+            try:
+                req = json.loads(body or b"{}")
+            except ValueError:
+                raise HttpError(400, "JSON invalide") from None
+            if not isinstance(req, dict):
+                raise HttpError(400, "objet JSON attendu")
+            try:
+                req = check_request(req)
+            except ValueError as e:
+                raise HttpError(400, str(e)) from None
+            if path == "/quote":
+                await self.respond(writer, 200, await self.run_cpu(quote_job, req), keep_alive)
+            else:
+                pdf = await self.run_cpu(pdf_job, req)
+                await self.respond_pdf(writer, pdf, req.get("devis_num") or "devis", keep_alive)
+        except HttpError as e:
+            await self.respond(writer, e.status, {"error": str(e)}, keep_alive, retry_after=e.status == 503)
+        except asyncio.IncompleteReadError:
+            return False
+        except Exception:
+            traceback.print_exc()  # le détail reste dans le journal du service, pas dans la réponse
+            await self.respond(writer, 500, {"error": "erreur interne"}, keep_alive)
+        return keep_alive
+
+    async def respond(self, writer, status, payload, keep_alive, retry_after=False):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        extra = "Retry-After: 1\r\n" if retry_after else ""
+        writer.write(self._head(status, "application/json; charset=utf-8", len(body), keep_alive, extra) + body)
+        await writer.drain()
+
+    async def respond_pdf(self, writer, pdf, name, keep_alive):
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        extra = f'Content-Disposition: attachment; filename="{safe}.pdf"\r\n'
+        writer.write(self._head(200, "application/pdf", len(pdf), keep_alive, extra))
+        view = memoryview(pdf)
+        for i in range(0, len(pdf), PDF_CHUNK):
+            writer.write(view[i:i + PDF_CHUNK])
+            await writer.drain()  # le client lent ralentit l'envoi, pas la mémoire du serveur
+
+    @staticmethod
+    def _head(status, content_type, length, keep_alive, extra=""):
+        return (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {length}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n{extra}\r\n").encode("latin-1")
+
+async def serve(host, port, workers, max_waiting):
+    app = QuoteServer(workers, max_waiting)
+    server = await asyncio.start_server(app.handle, host, port, limit=MAX_HEADER_BYTES)
+    print(f"Service de devis sur http://{host}:{port} ({workers} processus, {max_waiting} en attente max)", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.pool.shutdown(cancel_futures=True)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Service HTTP local de devis.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=0, help="processus de calcul (défaut : nombre de cœurs)")
+    p.add_argument("--max-waiting", type=int, default=512, help="demandes en attente au-delà desquelles on répond 503")
+    args = p.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers or os.cpu_count() or 1, args.max_waiting))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
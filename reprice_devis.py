@@ -0,0 +1,156 @@
+"""
+Réévaluation en masse des devis contre une nouvelle version de la grille de prix.
+
+Entrée : l'historique (--history, filtrable par période et métier) ou un fichier JSONL,
+un devis par ligne, au format de QuoteHistory.load :
+    {"devis_num": "...", "metier": "couvreur", "tva_rate": 10, "lines": [...], "header": {...}}
+Grille : --prices, des fichiers <métier>.json ou un dossier qui en contient
+(par défaut : catalog/ tel qu'il est sur disque). Une ligne dont le PU n'est pas celui
+du catalogue au moment du chiffrage a été saisie à la main et garde son PU : ce PU
+d'origine est noté sur chaque ligne enregistrée ("catalog_price"). Pour les devis qui
+ne le portent pas (enregistrés avant, ou JSONL), --old-prices donne la grille avec
+laquelle ils ont été chiffrés ; sans elle, ils ressortent en erreur.
+
+Sortie dans --out :
+- report.csv : anciens et nouveaux totaux et écart, pour chaque devis ;
+- repriced.jsonl : les devis dont le total change, avec leurs nouvelles lignes et totaux ;
+- avec --pdf : un PDF par devis dont le total change, et seulement ceux-là.
+Avec --history --save, ces devis sont aussi réécrits dans l'historique, sous le même
+numéro et à la même date, avec un PDF régénéré.
+
+    python reprice_devis.py --history --from 2026-09-01 --prices nouveaux_prix/ --out reprice/ --pdf --save
+    python reprice_devis.py devis.jsonl --prices nouveaux_prix/couvreur.json --out reprice/
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import wait
+from datetime import date
+
+from batch_devis import read_requests
+from devis import TVA_DEFAULT, CONDITIONS_DEFAULT
+from devis.history import quote_history
+from devis.jobs import submit_pdf
+from devis.lines import QuoteLines
+from devis.prices import CATALOG_DIR
+from devis.reprice import CHUNK_SIZE, PriceTable, reprice_records, tva_of
+
+CSV_FIELDS = ["devis_num", "client", "metier", "n_lines", "old_total", "new_total", "delta", "pdf", "error"]
+
+def _client(header):
+    client = header.get("client") or {}
+    return {"name": client} if isinstance(client, str) else client
+
+def run(args):
+    previous = PriceTable.load(args.old_prices) if args.old_prices else None
+    table = PriceTable.load(args.prices or [CATALOG_DIR], previous=previous)
+    if previous is not None and previous.prices == table.prices:
+        # catalogue modifié sur place puis donné deux fois : toute ligne paraîtrait saisie à la main
+        print("--old-prices donne la même grille que --prices : rien ne serait réévalué.", file=sys.stderr)
+        return 2
+    if args.history:
+        records = quote_history().records(date_from=args.date_from, date_to=args.date_to, metier=args.metier)
+    else:
+        records = read_requests(args.input)
+    os.makedirs(args.out, exist_ok=True)
+    date_str = date.fromisoformat(args.date).strftime("%d/%m/%Y")
+
+    processed = changed = errors = 0
+    delta_c = 0
+    t0 = time.perf_counter()
+    with open(os.path.join(args.out, "report.csv"), "w", newline="", encoding="utf-8") as report, \
+            open(os.path.join(args.out, "repriced.jsonl"), "w", encoding="utf-8") as repriced:
+        writer = csv.DictWriter(report, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        # lignes du rapport du paquet en cours, dans l'ordre d'entrée : (ligne, devis, en-tête, lignes, Future du PDF),
+        # devis à None s'il n'y a rien à réécrire
+        pending = []
+
+        def flush():
+            # rendus du paquet attendus avant d'en lire un autre : mémoire bornée
+            wait([fut for *_, fut in pending if fut is not None])
+            for row, rec, header, lines, fut in pending:
+                if rec is None:
+                    writer.writerow(row)
+                    continue
+                pdf = None
+                if fut is not None:
+                    pdf = fut.result()
+                if args.pdf:
+                    row["pdf"] = "".join(c if c.isalnum() or c in "-_" else "_" for c in row["devis_num"]) + ".pdf"
+                    with open(os.path.join(args.out, row["pdf"]), "wb") as f:
+                        f.write(pdf)
+                if args.save:
+                    quote_history().save(row["devis_num"], rec["metier"], _client(header), lines,
+                                         rec["tva_rate"], header=header, pdf=pdf, day=rec["day"], replace=True)
+                writer.writerow(row)
+            pending.clear()
+            report.flush()
+
+        for rec, lines, old, new, error in reprice_records(records, table, args.tva, args.chunk_size):
+            if len(pending) >= args.chunk_size:
+                flush()
+            processed += 1
+            header = rec.get("header") or {}
+            row = {"devis_num": rec.get("devis_num") or rec.get("id", ""), "client": _client(header).get("name", ""),
+                   "metier": rec.get("metier", "")}
+            if error:
+                errors += 1
+                row["error"] = error
+                pending.append((row, None, None, None, None))
+                continue
+            row.update(n_lines=len(lines), old_total=f"{old[2] / 100:.2f}", new_total=f"{new[2] / 100:.2f}",
+                       delta=f"{(new[2] - old[2]) / 100:.2f}")
+            if new == old:
+                pending.append((row, None, None, None, None))
+                continue
+            changed += 1
+            delta_c += new[2] - old[2]
+            metier = rec["metier"]
+            # postes ajoutés depuis le catalogue : repris au nouveau prix au prochain rechargement
+            header = dict(header, extra_lines=[table.reprice_line(ln, metier) for ln in header.get("extra_lines", [])])
+            repriced.write(json.dumps(dict(rec, lines=lines, header=header, subtotal_c=new[0], tva_c=new[1],
+                                           total_c=new[2], price_version=table.version), ensure_ascii=False) + "\n")
+            fut = None
+            if args.pdf or args.save:  # un devis réécrit ne garde pas l'ancien PDF
+                qlines = QuoteLines(lines)
+                fut = submit_pdf(company=header.get("company", {}), client=_client(header), devis_num=row["devis_num"],
+                                 date_str=date_str, lines=qlines, tva_rate=tva_of(rec, args.tva),
+                                 subtotal=new[0] / 100, tva=new[1] / 100, total=new[2] / 100,
+                                 conditions=header.get("conditions", CONDITIONS_DEFAULT))
+            pending.append((row, rec, header, lines, fut))
+        flush()
+
+    elapsed = time.perf_counter() - t0
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"Grille {table.version} : {processed} devis en {elapsed:.2f} s ({rate:.0f} devis/s), "
+          f"{changed} modifiés (écart total TTC {delta_c / 100:+.2f} €), {errors} erreurs.", file=sys.stderr)
+    return 1 if errors else 0
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Réévalue des devis enregistrés ou en JSONL avec une nouvelle grille de prix.")
+    p.add_argument("input", nargs="?", help="fichier JSONL des devis (sinon --history)")
+    p.add_argument("--history", action="store_true", help="réévalue les devis de l'historique")
+    p.add_argument("--from", dest="date_from", help="historique : devis à partir de cette date (AAAA-MM-JJ)")
+    p.add_argument("--to", dest="date_to", help="historique : devis jusqu'à cette date incluse")
+    p.add_argument("--metier", help="historique : seulement ce métier")
+    p.add_argument("--prices", nargs="+", help="grille : fichiers <métier>.json ou dossiers (défaut : catalog/)")
+    p.add_argument("--old-prices", nargs="+", help="grille des devis dont les lignes ne portent pas leur PU d'origine")
+    p.add_argument("--out", default="reprice_out", help="dossier du rapport, des devis modifiés et des PDF")
+    p.add_argument("--pdf", action="store_true", help="régénère le PDF des devis dont le total change")
+    p.add_argument("--save", action="store_true", help="historique : enregistre les devis modifiés")
+    p.add_argument("--tva", type=float, default=TVA_DEFAULT, help="TVA des devis JSONL qui n'en donnent pas")
+    p.add_argument("--date", default=date.today().isoformat(), help="date portée sur les PDF régénérés")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="devis traités par paquet")
+    args = p.parse_args(argv)
+    if bool(args.input) == args.history:
+        p.error("donner soit un fichier JSONL, soit --history")
+    if args.save and not args.history:
+        p.error("--save ne s'applique qu'à --history")
+    return run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
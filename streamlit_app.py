@@ -1,383 +1,97 @@
-import re
-import io
+import hashlib
+import json
+import time
+from concurrent.futures import wait
 from datetime import date
 import streamlit as st
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
+from devis import (
+    PRICES, TRADES, TVA_DEFAULT, CONDITIONS_DEFAULT, catalog,
+    extract_couvreur_from_text_advanced, compute_totals, QuoteLines,
+    couvreur_rules, METRICS,
+)
+from devis.fuzzy import trade_index
+from devis.history import quote_history
+from devis.jobs import submit_pdf, estimated_seconds
+from devis.router import extract_multi, apply_rules_by_trade
 
 APP_TITLE = "FactureIA — Devis multi-métiers (Couvreur avancé)"
-TVA_DEFAULT = 10
+PDF_POLL_S = 0.3            # attente max par passage pendant un rendu PDF
+SPECULATIVE_DELAY_S = 3.0   # devis inchangé depuis ce délai → PDF préparé d'avance
 
 # =========================
-#   CATALOGUES PAR METIER
+#   ETAT DU DEVIS (SESSION)
 # =========================
-PRICES = {
-    "couvreur": {
-        # --- Nettoyage toiture ---
-        "nettoyage_toiture_traitement": {"label": "Traitement toiture", "unit": "m²", "unit_price": 5.0},
-        "nettoyage_toiture_hydrofuge": {"label": "Hydrofuge toiture", "unit": "m²", "unit_price": 6.0},
-        "nettoyage_toiture_hydrofuge_colore": {"label": "Hydrofuge coloré toiture (coloris au choix)", "unit": "m²", "unit_price": 25.0},
-
-        # --- Faîtage & rives ---
-        "demolition_faitage_maconne_ml": {"label": "Démolition faîtage maçonné + évacuation", "unit": "ml", "unit_price": 60.0},
-        "depose_faitage_sec_ml": {"label": "Dépose faîtage à sec + évacuation", "unit": "ml", "unit_price": 20.0},
-        "mise_en_place_faitage_sec_ml": {"label": "Mise en place faîtage à sec", "unit": "ml", "unit_price": 80.0},
-        "chassis_bois_ml": {"label": "Châssis bois sapin traité", "unit": "ml", "unit_price": 30.0},
-        "pose_rives_ml": {"label": "Pose rives", "unit": "ml", "unit_price": 80.0},
-        "ragreage_faitage_maconne_ml": {"label": "Ragréage faîtage maçonné", "unit": "ml", "unit_price": 60.0},
-        "ragreage_rives_ml": {"label": "Ragréage rives", "unit": "ml", "unit_price": 50.0},
-        "resine_hydrofuge_faitage_ml": {"label": "Résine hydrofuge faîtage", "unit": "ml", "unit_price": 90.0},
-        "resine_hydrofuge_rives_ml": {"label": "Résine hydrofuge rives", "unit": "ml", "unit_price": 90.0},
-        "realisation_faitage_maconne_ml": {"label": "Réalisation faîtage maçonné / à l'ancienne", "unit": "ml", "unit_price": 150.0},
-
-        # --- Toiture complète ---
-        "depose_toiture_m2": {"label": "Dépose toiture + évacuation gravats", "unit": "m²", "unit_price": 23.0},
-        "pose_liteaux_m2": {"label": "Mise en place liteaux + contre-liteaux", "unit": "m²", "unit_price": 17.0},
-        "pose_ecran_sous_toiture_m2": {"label": "Pose écran sous toiture", "unit": "m²", "unit_price": 17.0},
-
-        # --- Pose tuiles (49 €/m² pour tous types pour l'instant) ---
-        "pose_tuile_dc12_m2": {"label": "Pose tuiles DC12", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_canal_s_m2": {"label": "Pose tuiles canal S", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_canal_m2": {"label": "Pose tuiles canal", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_plain_ciel_m2": {"label": "Pose tuiles Plain Ciel", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_g13_m2": {"label": "Pose tuiles G13 (gothique)", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_romane_m2": {"label": "Pose tuiles romane", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_meridional_m2": {"label": "Pose tuiles méridional", "unit": "m²", "unit_price": 49.0},
-        "pose_tuile_redland_m2": {"label": "Pose tuiles Redland", "unit": "m²", "unit_price": 49.0},
-
-        # --- Zinguerie ---
-        "gouttiere_alu_g300_ml": {"label": "Création & pose gouttière alu G300", "unit": "ml", "unit_price": 45.0},
-        "gouttiere_zinc_ml": {"label": "Création & pose gouttière zinc", "unit": "ml", "unit_price": 90.0},
-        "depose_gouttieres_ml": {"label": "Dépose gouttières + évacuation", "unit": "ml", "unit_price": 5.0},
-        "entourage_cheminee_forfait": {"label": "Entourage de cheminée (neuf)", "unit": "forfait", "unit_price": 600.0},
-        "depose_entourage_cheminee_forfait": {"label": "Dépose ancien entourage de cheminée + évacuation", "unit": "forfait", "unit_price": 100.0},
-        "noue_ml": {"label": "Pose noue", "unit": "ml", "unit_price": 120.0},
-        "couloir_zinc_ml": {"label": "Pose couloir zinc", "unit": "ml", "unit_price": 90.0},
-        "solin_zinc_alu_ml": {"label": "Solin (zinc/alu)", "unit": "ml", "unit_price": 180.0},
-
-        # --- Habillage & bois ---
-        "avant_toit_pvc_m2": {"label": "Avant-toit PVC", "unit": "m²", "unit_price": 90.0},
-        "habillage_planche_rive_pvc_ml": {"label": "Habillage planche de rive PVC", "unit": "ml", "unit_price": 45.0},
-        "habillage_planche_rive_alu_ml": {"label": "Habillage planche de rive alu", "unit": "ml", "unit_price": 48.0},
-        "pose_pdr_bois_ml": {"label": "Mise en place de PDR en bois", "unit": "ml", "unit_price": 40.0},
-        "remplacement_chevron_u": {"label": "Remplacement chevron", "unit": "u", "unit_price": 190.0},
-
-        # --- Ouvertures / divers ---
-        "depose_cheminee_forfait": {"label": "Dépose d'une cheminée + évacuation", "unit": "forfait", "unit_price": 600.0},  # +200 si grosse cheminée
-        "depose_fenetre_toit_fermeture_forfait": {"label": "Dépose fenêtre de toit (Velux) + fermeture", "unit": "forfait", "unit_price": 500.0},
-        "joint_etancheite_custom": {"label": "Joint d’étanchéité (à définir)", "unit": "forfait", "unit_price": 0.0},
-
-        # --- Isolation & charpente ---
-        "isolation_laine_roche_m2": {"label": "Isolation laine de roche", "unit": "m²", "unit_price": 20.0},
-        "isolation_laine_verre_m2": {"label": "Isolation laine de verre", "unit": "m²", "unit_price": 18.0},
-        "isolation_ouate_m2": {"label": "Isolation ouate de cellulose", "unit": "m²", "unit_price": 15.0},
-        "evacuation_ancienne_isolation_m2": {"label": "Évacuation de l’ancienne isolation", "unit": "m²", "unit_price": 15.0},
-        "traitement_charpente_m2": {"label": "Traitement de charpente", "unit": "m²", "unit_price": 25.0},
-
-        # --- Tuiles cassées ---
-        "remplacement_tuiles_cassees_u": {"label": "Remplacement tuiles cassées", "unit": "u", "unit_price": 13.0},
-    },
-
-    # Structures à remplir plus tard
-    "maconnerie": {},
-    "placo": {},
-    "elagage": {},
-    "carreleur": {},
+# Chaque widget relance tout le script : les étapes coûteuses sont mémorisées dans
+# st.session_state et ne sont recalculées que si leurs entrées ont changé.
+
+def fingerprint(*parts):
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+def quote_state():
+    return st.session_state.setdefault("quote", {"stages": {}, "manual_lines": [], "pdf": None})
+
+def cached_stage(name, inputs_fp, compute):
+    """Renvoie le résultat mémorisé de l'étape `name` tant que l'empreinte de ses entrées ne change pas."""
+    stages = quote_state()["stages"]
+    hit = stages.get(name)
+    if hit is not None and hit[0] == inputs_fp:
+        return hit[1]
+    value = compute()
+    stages[name] = (inputs_fp, value)
+    return value
+
+def apply_pending_reload():
+    """Recharge un devis de l'historique dans les widgets (avant leur création, sinon Streamlit refuse)."""
+    ss = st.session_state
+    # valeurs initiales posées ici plutôt que par `value=` : un widget ne doit pas avoir les deux
+    for k, v in WIDGET_DEFAULTS.items():
+        ss.setdefault(k, v)
+    if "next_devis_num" in ss:
+        ss["devis_num"] = ss.pop("next_devis_num")
+    pending = ss.pop("reload_quote", None)
+    if pending is None:
+        return
+    rec, duplicate = pending
+    h = rec["header"]
+    ss["metier"] = rec["metier"]
+    ss["client_name"] = h["client"].get("name", "")
+    ss["client_addr"] = h["client"].get("addr", "")
+    ss["user_text"] = h.get("text", "")
+    ss["grosse_cheminee"] = h.get("grosse_cheminee", False)
+    ss["tva_rate"] = int(rec["tva_rate"])
+    ss["conditions"] = h.get("conditions", CONDITIONS_DEFAULT)
+    ss["devis_num"] = "" if duplicate else rec["devis_num"]  # un duplicata reçoit un nouveau numéro
+    # seul un devis rechargé peut être réenregistré sous son numéro (correction)
+    quote_state()["loaded_num"] = None if duplicate else rec["devis_num"]
+    ss["catalog_pick"] = []
+    # postes du catalogue et lignes manuelles : repris tels quels, la saisie libre est ré-analysée
+    quote_state()["manual_lines"] = [dict(ln) for ln in h.get("extra_lines", [])]
+
+PLACEHOLDER = (
+    "Exemples :\n"
+    "- Nettoyage toiture 120 m² avec hydrofuge coloré\n"
+    "- Démolition faîtage maçonné 18 ml + pose faîtage à sec 18 ml + châssis sapin\n"
+    "- Gouttières alu G300 22 ml + dépose anciennes 22 ml\n"
+    "- Isolation laine de roche 60 m² + évacuation ancienne isolation 60 m²\n"
+    "- Dépose cheminée + fermeture, pose noue 6 ml, solin zinc 8 ml\n"
+    "- Habillage planche de rive PVC 15 ml, avant-toit PVC 20 m²\n"
+    "- Remplacer 12 tuiles, traitement charpente 80 m²"
+)
+WIDGET_DEFAULTS = {
+    "client_name": "Mme BLANC", "client_addr": "", "user_text": PLACEHOLDER, "grosse_cheminee": False,
+    "tva_rate": TVA_DEFAULT, "devis_num": "", "conditions": CONDITIONS_DEFAULT, "auto_trades": True,
 }
 
-# =========================
-#   HELPERS & NLP
-# =========================
-
-FRENCH_QTY_WORDS = {"quinzaine":15,"douzaine":12,"dizaine":10,"quinze":15,"douze":12,"dix":10,"vingt":20}
-
-def num(s):
-    try: return float(s.replace(",", "."))
-    except: return None
-
-def qty_from_words(w):
-    return float(FRENCH_QTY_WORDS.get(w.lower().strip(), 0))
-
-def find_qty(text, unit_kind):
-    """
-    unit_kind in {"ml","m2","u","forfait"}
-    """
-    if unit_kind == "ml":
-        m = re.search(r"(\d+[,.]?\d*)\s*(?:m|ml|m(?:è|e)tre?s?\s*lin(?:é|e)aires?)", text)
-        return num(m.group(1)) if m else 0.0
-    if unit_kind == "m2":
-        m = re.search(r"(\d+[,.]?\d*)\s*(?:m2|m²|m\^?2|m(?:è|e)tre?s?\s*carr(?:é|e)s?)", text)
-        return num(m.group(1)) if m else 0.0
-    if unit_kind == "u":
-        m = re.search(r"(\d+)\s*(?:u|unit(?:é|e)s?|tuiles?|chevrons?)", text)
-        if m: return float(m.group(1))
-        m2 = re.search(r"(?:une?\s+)?([a-zéèêîïç]+)\s+(?:de\s+)?(?:tuiles?|chevrons?)", text)
-        if m2: return qty_from_words(m2.group(1))
-        return 0.0
-    return 1.0  # forfait par défaut
-
-def add_line(lines, key, qty, meta=None):
-    cfg = PRICES["couvreur"][key]
-    ln = {"key": key, "label": cfg["label"], "unit": cfg["unit"], "unit_price": cfg["unit_price"], "qty": float(qty)}
-    if meta:
-        ln.update(meta)
-    lines.append(ln)
-
-def extract_couvreur_from_text_advanced(text: str):
-    """
-    Détecte les prestations couvreur sur un texte libre (français).
-    Couvre tout le catalogue défini plus haut.
-    """
-    txt = text.lower()
-
-    lines = []
-
-    # --- Nettoyage ---
-    if re.search(r"\btraitement\b.*toiture|\btraiter\b.*toiture", txt):
-        add_line(lines, "nettoyage_toiture_traitement", find_qty(txt, "m2") or 0)
-    if re.search(r"\bhydrofuge\b(?!.*color)", txt) or re.search(r"imperm(?:é|e)abilis", txt):
-        add_line(lines, "nettoyage_toiture_hydrofuge", find_qty(txt, "m2") or 0)
-    if re.search(r"\bhydrofuge\s+color(é|e)", txt):
-        add_line(lines, "nettoyage_toiture_hydrofuge_colore", find_qty(txt, "m2") or 0)
-
-    # --- Faîtage & rives ---
-    if re.search(r"d(é|e)molition.*fa[iî]tage.*ma(ç|c)onn", txt):
-        add_line(lines, "demolition_faitage_maconne_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"d(é|e)pose.*fa[iî]tage.*(sec|syst(è|e)me\s+sec)", txt):
-        add_line(lines, "depose_faitage_sec_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"(mise\s+en\s+place|pose).*(fa[iî]tage).*(sec|syst(è|e)me\s+sec)", txt):
-        add_line(lines, "mise_en_place_faitage_sec_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"ch(a|â)ssis.*(sapin|bois)", txt):
-        add_line(lines, "chassis_bois_ml", find_qty(txt, "ml") or 0)
-
-    if re.search(r"\bragr(é|e)age\b.*fa[iî]tage", txt):
-        add_line(lines, "ragreage_faitage_maconne_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"\bragr(é|e)age\b.*rives?", txt):
-        add_line(lines, "ragreage_rives_ml", find_qty(txt, "ml") or 0)
-
-    if re.search(r"(rives?|rive)\b.*(poser|pose|mise\s+en\s+place)", txt) or re.search(r"\bpose\s+de\s+rives?", txt):
-        add_line(lines, "pose_rives_ml", find_qty(txt, "ml") or 0)
-
-    if re.search(r"r(é|e)sine.*hydrofuge.*fa[iî]tage", txt):
-        add_line(lines, "resine_hydrofuge_faitage_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"r(é|e)sine.*hydrofuge.*rives?", txt):
-        add_line(lines, "resine_hydrofuge_rives_ml", find_qty(txt, "ml") or 0)
-
-    if re.search(r"fa[iî]tage.*(ma(ç|c)onn(é|e)|ancien|ancienne)", txt):
-        add_line(lines, "realisation_faitage_maconne_ml", find_qty(txt, "ml") or 0)
-
-    # --- Toiture complète ---
-    if re.search(r"d(é|e)pose.*toiture", txt):
-        add_line(lines, "depose_toiture_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"(liteau|liteaux).*(contre[-\s]?liteau|contre[-\s]?liteaux)|mise\s+en\s+place\s+des?\s+liteaux", txt):
-        add_line(lines, "pose_liteaux_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"(é|e)cran\s+sous\s+toiture|hpv|sous[-\s]?toiture", txt):
-        add_line(lines, "pose_ecran_sous_toiture_m2", find_qty(txt, "m2") or 0)
-
-    # --- Pose tuiles (types) ---
-    m2_qty = find_qty(txt, "m2") or 0
-    if re.search(r"pose.*tuiles?.*dc\s*12|dc12", txt): add_line(lines, "pose_tuile_dc12_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*canal\s*s", txt): add_line(lines, "pose_tuile_canal_s_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*canal(?!\s*s)", txt): add_line(lines, "pose_tuile_canal_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*plain\s*ciel", txt): add_line(lines, "pose_tuile_plain_ciel_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*g13|gothique", txt): add_line(lines, "pose_tuile_g13_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*roman(e|es?)", txt): add_line(lines, "pose_tuile_romane_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*m(é|e)ridion(al|aux|ale|ales)", txt): add_line(lines, "pose_tuile_meridional_m2", m2_qty)
-    if re.search(r"pose.*tuiles?.*redland", txt): add_line(lines, "pose_tuile_redland_m2", m2_qty)
-
-    # --- Tuiles cassées ---
-    if re.search(r"(changer|remplacer)\s+(\d+|\w+)\s+tuil", txt):
-        qty = find_qty(txt, "u")
-        add_line(lines, "remplacement_tuiles_cassees_u", qty or 0)
-
-    # --- Zinguerie ---
-    if re.search(r"goutti(è|e)res?.*alu.*g\s*300|g300", txt):
-        add_line(lines, "gouttiere_alu_g300_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"goutti(è|e)res?.*zinc", txt):
-        add_line(lines, "gouttiere_zinc_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"d(é|e)pose.*goutti(è|e)res?", txt):
-        add_line(lines, "depose_gouttieres_ml", find_qty(txt, "ml") or 0)
-
-    if re.search(r"entourage.*chemin(é|e)e", txt) and not re.search(r"d(é|e)pose.*entourage", txt):
-        add_line(lines, "entourage_cheminee_forfait", 1)
-    if re.search(r"d(é|e)pose.*entourage.*chemin(é|e)e", txt):
-        add_line(lines, "depose_entourage_cheminee_forfait", 1)
-
-    if re.search(r"\bnoues?\b", txt):
-        add_line(lines, "noue_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"couloirs?.*zinc", txt):
-        add_line(lines, "couloir_zinc_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"\bsolins?\b", txt):
-        add_line(lines, "solin_zinc_alu_ml", find_qty(txt, "ml") or 0)
-
-    # --- Habillage & bois ---
-    if re.search(r"avant[-\s]?toit.*pvc|sous[-\s]?face.*pvc|cache[-\s]?moineaux.*pvc", txt):
-        add_line(lines, "avant_toit_pvc_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"habillage.*planche.*rive.*pvc", txt):
-        add_line(lines, "habillage_planche_rive_pvc_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"habillage.*planche.*rive.*alu|minium", txt):
-        add_line(lines, "habillage_planche_rive_alu_ml", find_qty(txt, "ml") or 0)
-    if re.search(r"\bpdr\b.*bois|pi(è|e)ce.*bois.*rive", txt):
-        add_line(lines, "pose_pdr_bois_ml", find_qty(txt, "ml") or 0)
-
-    if re.search(r"(changer|remplacer)\s+(\d+|\w+)\s+chevrons?", txt):
-        qty = find_qty(txt, "u")
-        add_line(lines, "remplacement_chevron_u", qty or 0)
-
-    # --- Ouvertures / divers ---
-    if re.search(r"d(é|e)pose.*(chemin(é|e)e)", txt):
-        # prix ajusté ensuite par switch "grosse cheminée"
-        add_line(lines, "depose_cheminee_forfait", 1)
-    if re.search(r"d(é|e)pose.*(fen(ê|e)tre\s+de\s+toit|velux).*(fermeture|rebouchage)?", txt):
-        add_line(lines, "depose_fenetre_toit_fermeture_forfait", 1)
-
-    if re.search(r"joint.*(étanch|etanch)", txt):
-        add_line(lines, "joint_etancheite_custom", 1)
-
-    # --- Isolation & charpente ---
-    if re.search(r"isolation.*laine.*roche", txt):
-        add_line(lines, "isolation_laine_roche_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"isolation.*laine.*verre", txt):
-        add_line(lines, "isolation_laine_verre_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"isolation.*ouate", txt):
-        add_line(lines, "isolation_ouate_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"(é|e)vacuation.*ancienne.*isolation", txt):
-        add_line(lines, "evacuation_ancienne_isolation_m2", find_qty(txt, "m2") or 0)
-    if re.search(r"traitement.*charpente", txt):
-        add_line(lines, "traitement_charpente_m2", find_qty(txt, "m2") or 0)
-
-    # --- Cas générique faîtage à sec (phrase courte) ---
-    # "15 ml de faîtage à refaire à sec" → kit dépose + mise en place + châssis
-    m = re.search(r"(\d+[,.]?\d*)\s*(?:m|ml|m(?:è|e)tre?s?)\s+.*fa[iî]tage.*(sec|syst(è|e)me\s+sec)", txt)
-    if m and not any(ln["key"] in {"depose_faitage_sec_ml","mise_en_place_faitage_sec_ml","chassis_bois_ml"} for ln in lines):
-        qty_ml = float(m.group(1).replace(",", "."))
-        add_line(lines, "depose_faitage_sec_ml", qty_ml)
-        add_line(lines, "mise_en_place_faitage_sec_ml", qty_ml)
-        add_line(lines, "chassis_bois_ml", qty_ml)
-
-    # Nettoyage → si aucune ligne m² n'a été trouvée mais on mentionne "nettoyage/hydrofuge"
-    if not any(l["unit"]=="m²" and l["qty"]>0 for l in lines):
-        if re.search(r"nettoyage|hydrofuge|traitement\s+toiture", txt):
-            # si l'utilisateur n'a pas mis la surface, on laisse 0 (il ajustera)
-            pass
-
-    # Tuiles → si "changer tuiles" sans nombre, laisse 0 pour que l'artisan ajuste
-    return lines
-
-def compute_totals(lines, tva_rate):
-    subtotal = round(sum(ln["qty"] * ln["unit_price"] for ln in lines), 2)
-    tva = round(subtotal * (tva_rate / 100.0), 2)
-    total = round(subtotal + tva, 2)
-    return subtotal, tva, total
-
-def make_pdf_devis(company, client, devis_num, date_str, lines, tva_rate, subtotal, tva, total, conditions):
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    width, height = A4
-
-    x_margin = 2 * cm
-    y = height - 2 * cm
-
-    # Header
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(x_margin, y, company.get("name", "FactureIA"))
-    c.setFont("Helvetica", 10); y -= 14
-    c.drawString(x_margin, y, company.get("addr", "Adresse"))
-    y -= 12; c.drawString(x_margin, y, company.get("siret", "SIRET: "))
-    y -= 20
-
-    # Client / devis
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(x_margin, y, f"DEVIS n° {devis_num}")
-    y -= 14; c.setFont("Helvetica", 10)
-    c.drawString(x_margin, y, f"Date : {date_str}")
-    y -= 12; c.drawString(x_margin, y, f"Client : {client.get('name','')}")
-    y -= 12
-    if client.get("addr"):
-        c.drawString(x_margin, y, f"Adresse : {client['addr']}"); y -= 12
-    y -= 8
-
-    # Table header
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(x_margin, y, "Désignation")
-    c.drawString(x_margin + 9*cm, y, "Qté")
-    c.drawString(x_margin + 11*cm, y, "PU")
-    c.drawString(x_margin + 14*cm, y, "Total")
-    y -= 12; c.setFont("Helvetica", 10)
-    c.line(x_margin, y, width - x_margin, y); y -= 6
-
-    # Lines
-    for ln in lines:
-        line_total = ln["qty"] * ln["unit_price"]
-        c.drawString(x_margin, y, ln["label"])
-        c.drawRightString(x_margin + 10*cm, y, f"{ln['qty']:.2f} {ln['unit']}")
-        c.drawRightString(x_margin + 13*cm, y, f"{ln['unit_price']:.2f} €")
-        c.drawRightString(width - x_margin, y, f"{line_total:.2f} €")
-        y -= 12
-        if y < 5*cm:
-            c.showPage(); y = height - 2*cm
-
-    # Totals
-    y -= 10; c.line(x_margin, y, width - x_margin, y); y -= 14
-    c.setFont("Helvetica-Bold", 10)
-    c.drawRightString(x_margin + 13*cm, y, "Sous-total :")
-    c.drawRightString(width - x_margin, y, f"{subtotal:.2f} €")
-    y -= 12
-    c.drawRightString(x_margin + 13*cm, y, f"TVA ({tva_rate:.0f}%) :")
-    c.drawRightString(width - x_margin, y, f"{tva:.2f} €")
-    y -= 12
-    c.drawRightString(x_margin + 13*cm, y, "Total TTC :")
-    c.drawRightString(width - x_margin, y, f"{total:.2f} €")
-
-    # Footer
-    y -= 24; c.setFont("Helvetica", 9)
-    for i in range(0, len(conditions), 90):
-        c.drawString(x_margin, y, conditions[i:i+90]); y -= 12
-
-    c.save(); buf.seek(0)
-    return buf
-
-# =========================
-#   BUSINESS RULES
-# =========================
-def apply_business_rules(metier, lines, grosse_cheminee=False):
-    out = []
-
-    # 0) Ajout auto: Vérification (pour couvreur)
-    if metier == "couvreur":
-        out.append({
-            "label": "Vérification toiture avant travaux",
-            "qty": 1, "unit": "forfait", "unit_price": 0.0
-        })
-
-    # 1) Copier les lignes saisies/détectées
-    out.extend(lines)
-
-    if metier == "couvreur":
-        # 2) Si nettoyage présent → tuiles cassées = 0 €
-        has_cleaning = any(ln.get("key","").startswith("nettoyage_toiture_") for ln in lines)
-        for ln in out:
-            if ln.get("key") == "remplacement_tuiles_cassees_u" and has_cleaning:
-                ln["unit_price"] = 0.0
-
-        # 3) Switch grosse cheminée (+200€)
-        if grosse_cheminee:
-            for ln in out:
-                if ln.get("key") == "depose_cheminee_forfait":
-                    ln["unit_price"] = 800.0  # sinon 600 par défaut
-
-    return out
-
 # =========================
 #   APP UI
 # =========================
 st.set_page_config(page_title=APP_TITLE, page_icon="🧾")
 st.title(APP_TITLE)
 st.caption("Écris tes travaux en français : l’app détecte toutes les prestations Couvreur, applique les règles, et génère le PDF. Multi-métiers prêt pour la suite.")
+apply_pending_reload()
 
 # Choix du métier (Couvreur actif pour l’IA, les autres arrivent)
-metier = st.selectbox("Choisir le métier :", ["couvreur","maconnerie","placo","elagage","carreleur"])
+metier = st.selectbox("Choisir le métier :", TRADES, key="metier")
 
 # Infos société / client
 colA, colB = st.columns(2)
@@ -386,37 +100,45 @@ with colA:
     company_addr = st.text_input("Adresse entreprise", value="12 Rue des Toits, 69000 Lyon")
     company_siret = st.text_input("SIRET", value="SIRET: 123 456 789 00012")
 with colB:
-    client_name = st.text_input("Nom du client", value="Mme BLANC")
-    client_addr = st.text_input("Adresse client", value="")
+    client_name = st.text_input("Nom du client", key="client_name")
+    client_addr = st.text_input("Adresse client", key="client_addr")
 
 # Saisie texte (l’IA couvreur avancée)
 st.subheader("Demande (texte libre)")
-placeholder = (
-    "Exemples :\n"
-    "- Nettoyage toiture 120 m² avec hydrofuge coloré\n"
-    "- Démolition faîtage maçonné 18 ml + pose faîtage à sec 18 ml + châssis sapin\n"
-    "- Gouttières alu G300 22 ml + dépose anciennes 22 ml\n"
-    "- Isolation laine de roche 60 m² + évacuation ancienne isolation 60 m²\n"
-    "- Dépose cheminée + fermeture, pose noue 6 ml, solin zinc 8 ml\n"
-    "- Habillage planche de rive PVC 15 ml, avant-toit PVC 20 m²\n"
-    "- Remplacer 12 tuiles, traitement charpente 80 m²"
-)
-user_text = st.text_area("Décris les travaux :", value=placeholder, height=160)
+user_text = st.text_area("Décris les travaux :", height=160, key="user_text")
+auto_trades = st.checkbox("Reconnaître les métiers dans la demande (devis multi-métiers)", key="auto_trades")
 
 # Lignes détectées
-auto_lines = []
-if metier == "couvreur" and user_text.strip():
-    auto_lines = extract_couvreur_from_text_advanced(user_text)
+catalog_stamps = tuple(catalog(t).stamp for t in TRADES)
+auto_lines, routed = [], []
+if user_text.strip():
+    if auto_trades:
+        # seuls les extracteurs des métiers évoqués tournent ; sinon, le métier choisi
+        auto_lines, routed = cached_stage("extract", fingerprint("auto", metier, catalog_stamps, user_text), lambda: extract_multi(user_text, default_trade=metier))
+        empty = [t for t, _ in routed if not len(catalog(t))]
+        st.caption("Métiers reconnus : " + (", ".join(t for t, _ in routed) or "aucun")
+                   + (f" — catalogue à venir : {', '.join(empty)}" if empty else ""))
+    elif metier == "couvreur":
+        auto_lines = cached_stage("extract", fingerprint(metier, catalog(metier).stamp, user_text), lambda: extract_couvreur_from_text_advanced(user_text))
 
 # Catalogue manuel (si tu veux compléter)
 st.subheader("Catalogue — ajouter des postes (optionnel)")
 with st.expander("➕ Ajouter depuis le catalogue"):
     if PRICES.get(metier):
-        key_list = list(PRICES[metier].keys())
-        show = st.multiselect("Choisis des postes à ajouter :", options=key_list, format_func=lambda k: PRICES[metier][k]["label"])
+        cat = catalog(metier)
+        query = st.text_input("Rechercher un poste (fautes et accents tolérés)", key="catalog_query")
+        options = cat.keys_by_label
+        if query.strip():
+            # postes classés par proximité ; ceux déjà choisis restent dans la liste
+            picked = st.session_state.get("catalog_pick", [])
+            ranked = [k for _, k in trade_index(metier).search(query, limit=20)]
+            options = picked + [k for k in ranked if k not in picked]
+            if not ranked:
+                st.caption("Aucun poste proche : essaie un autre mot.")
+        show = st.multiselect("Choisis des postes à ajouter :", options=options, format_func=lambda k: cat[k]["label"], key="catalog_pick")
         added = []
         for k in show:
-            cfg = PRICES[metier][k]
+            cfg = cat[k]
             col1, col2 = st.columns(2)
             with col1:
                 qty = st.number_input(f"Qté pour « {cfg['label']} » ({cfg['unit']})", min_value=0.0, step=1.0, value=0.0, key=f"qty_{k}")
@@ -437,57 +159,200 @@ with st.form("manual_line_form", clear_on_submit=True):
     qty = col3.number_input("Qté", min_value=0.0, value=0.0, step=1.0)
     pu = col4.number_input("PU €", min_value=0.0, value=0.0, step=1.0)
     manual_submit = st.form_submit_button("Ajouter la ligne")
-manual_lines = []
+manual_lines = quote_state()["manual_lines"]
 if manual_submit and label and qty > 0:
     manual_lines.append({"key":"manual", "label": label, "unit": unit, "unit_price": pu, "qty": qty})
     st.success(f"Ligne ajoutée : {label}")
+if manual_lines and st.button("Retirer les lignes manuelles"):
+    manual_lines.clear()
 
 # Options
 st.subheader("Options & TVA")
-grosse_cheminee = st.checkbox("Grosse cheminée (avec fermeture) → 800 €", value=False) if metier=="couvreur" else False
-tva_rate = st.slider("TVA (%)", min_value=0, max_value=20, value=TVA_DEFAULT, step=1)
-devis_num = st.text_input("N° de devis", value=f"D{date.today().strftime('%Y%m%d')}-001")
-conditions = st.text_area("Conditions (bas de page PDF)", value=(
-    "Vérification préalable offerte (couvreur). Remplacement tuiles cassées offert si prestation de nettoyage incluse. "
-    "Prix HT hors échafaudage spécifique. Validité 30 jours. Paiement: 30% acompte, solde à la réception. "
-    "Assurance décennale. Délais selon météo et approvisionnement."
-), height=80)
+grosse_cheminee = st.checkbox("Grosse cheminée (avec fermeture) → 800 €", key="grosse_cheminee") if "couvreur" in (metier, *(t for t, _ in routed)) else False
+tva_rate = st.slider("TVA (%)", min_value=0, max_value=20, step=1, key="tva_rate")
+devis_num = st.text_input("N° de devis", key="devis_num", placeholder="attribué automatiquement à la génération du PDF")
+conditions = st.text_area("Conditions (bas de page PDF)", height=80, key="conditions")
 
 # Construire les lignes
 lines = []
 lines.extend(auto_lines)
-if 'added' in locals(): lines.extend(added)
+lines.extend(added)
 lines.extend(manual_lines)
 
-# Appliquer règles
-lines = apply_business_rules(metier, lines, grosse_cheminee=grosse_cheminee)
+# Appliquer règles (déclarées dans le catalogue de chaque métier ; les lignes en cache ne sont pas modifiées)
+lines_fp = fingerprint(metier, catalog_stamps, lines, grosse_cheminee)
+lines = cached_stage("rules", lines_fp, lambda: apply_rules_by_trade(lines, metier, grosse_cheminee=grosse_cheminee))
 
 # Aperçu
 if lines:
     st.write("### Lignes du devis")
-    preview = [{"Désignation": l["label"], "Qté": l["qty"], "Unité": l["unit"], "PU €": l["unit_price"], "Total €": round(l["qty"]*l["unit_price"],2)} for l in lines]
+    # montants calculés une fois (centimes entiers), partagés par l'aperçu, les totaux et le PDF
+    qlines = cached_stage("amounts", lines_fp, lambda: QuoteLines(lines))
+    preview = cached_stage("preview", lines_fp, lambda: [{"Désignation": label, "Qté": q, "Unité": unit, "PU €": pu, "Total €": t} for label, q, unit, pu, t in qlines.rows()])
+    if len(routed) > 1:
+        preview = [dict(row, Métier=ln.get("metier", metier)) for row, ln in zip(preview, lines)]
     st.dataframe(preview)
-    subtotal, tva, total = compute_totals(lines, tva_rate)
+    approx = [ln["label"] for ln in auto_lines if "approx" in ln]
+    if approx:
+        st.caption("≈ Reconnu par rapprochement avec le catalogue, à vérifier : " + ", ".join(approx))
+    subtotal, tva, total = cached_stage("totals", fingerprint(lines_fp, tva_rate), lambda: compute_totals(qlines, tva_rate))
     st.write(f"**Sous-total**: {subtotal:.2f} €  •  **TVA ({tva_rate}%)**: {tva:.2f} €  •  **Total TTC**: {total:.2f} €")
 
-# PDF
+# PDF — rendu dans le pool partagé : ni cette session ni les autres utilisateurs n'attendent
+state = quote_state()
+if lines:
+    company = {"name": company_name, "addr": company_addr, "siret": company_siret}
+    client = {"name": client_name, "addr": client_addr}
+    date_str = date.today().strftime("%d/%m/%Y")
+    # PDF mémorisé contre l'empreinte du devis : re-cliquer sans rien changer est gratuit ;
+    # la stabilité du devis (PDF préparé d'avance) se juge sans le n°, réservé juste avant le rendu
+    draft_fp = fingerprint(lines_fp, tva_rate, company, client, date_str, conditions)
+    pdf_fp = fingerprint(draft_fp, devis_num)
+    pdf_kwargs = dict(company=company, client=client, devis_num=devis_num, date_str=date_str, lines=qlines,
+                      tva_rate=tva_rate, subtotal=subtotal, tva=tva, total=total, conditions=conditions)
+
+def start_pdf_job():
+    if state["pdf"] is not None and state["pdf"][0] == pdf_fp:
+        return
+    job = state.get("pdf_job")
+    if job is not None and job[0] == pdf_fp:
+        return
+    if job is not None:
+        job[1].cancel()  # devis modifié depuis : inutile s'il n'a pas encore démarré
+    state["pdf_job"] = (pdf_fp, submit_pdf(**pdf_kwargs), time.monotonic(), len(qlines))
+
+speculative = hasattr(st, "fragment") and st.checkbox("Préparer le PDF en avance quand le devis ne bouge plus", value=False)
 if st.button("Générer le PDF"):
     if not lines:
         st.warning("Ajoute au moins une ligne (texte, catalogue ou manuelle).")
+    elif not devis_num.strip():
+        # numéro réservé dans la séquence du jour, puis relance avec le champ rempli
+        st.session_state["next_devis_num"] = quote_history().next_devis_num()
+        state["pdf_requested"] = True
+        st.rerun()
+    elif devis_num != state.get("loaded_num") and quote_history().exists(devis_num):
+        st.error(f"Le n° {devis_num} est déjà celui d'un autre devis : vide le champ pour en attribuer un nouveau, "
+                 "ou recharge ce devis depuis l'historique pour le corriger.")
     else:
-        subtotal, tva, total = compute_totals(lines, tva_rate)
-        pdf = make_pdf_devis(
-            company={"name": company_name, "addr": company_addr, "siret": company_siret},
-            client={"name": client_name, "addr": client_addr},
-            devis_num=devis_num,
-            date_str=date.today().strftime("%d/%m/%Y"),
-            lines=lines,
-            tva_rate=tva_rate,
-            subtotal=subtotal,
-            tva=tva,
-            total=total,
-            conditions=conditions
-        )
-        st.download_button("⬇️ Télécharger le devis (PDF)", data=pdf, file_name=f"{devis_num}.pdf", mime="application/pdf")
+        state["pdf_requested"] = True
 else:
     st.caption("Astuce : écris tout en une phrase (exemples au-dessus). L’IA ajoute les bonnes lignes. Tu peux compléter avec le catalogue ou une ligne manuelle.")
+
+if state.pop("pdf_requested", False) and lines:
+    start_pdf_job()
+    state["pdf_wanted"] = pdf_fp
+
+if lines:
+    job = state.get("pdf_job")
+    if job is not None and job[0] == pdf_fp and job[1].done():
+        state["pdf_job"] = None
+        if job[1].exception() is not None:
+            st.error(f"Échec du PDF : {job[1].exception()}")
+        else:
+            state["pdf"] = (pdf_fp, job[1].result())
+    if state.get("pdf_wanted") == pdf_fp:
+        if state["pdf"] is not None and state["pdf"][0] == pdf_fp:
+            state["pdf_wanted"] = None
+            try:
+                # un numéro existant n'est remplacé que pour le devis rechargé depuis l'historique
+                quote_history().save(
+                    devis_num, metier, client, lines, tva_rate, pdf=state["pdf"][1],
+                    header={"company": company, "text": user_text, "grosse_cheminee": grosse_cheminee,
+                            "conditions": conditions, "extra_lines": added + manual_lines},
+                    replace=devis_num == state.get("loaded_num"))
+            except ValueError as e:
+                st.error(f"Devis non enregistré : {e}.")
+            else:
+                # champ vidé : le devis suivant recevra un nouveau numéro au lieu d'écraser celui-ci
+                state["last_saved"] = (devis_num, state["pdf"][1])
+                state["saved_draft"] = draft_fp  # déjà enregistré : pas de nouveau n° ni de PDF d'avance
+                state["loaded_num"] = None
+                st.session_state["next_devis_num"] = ""
+                st.rerun()
+        elif state.get("pdf_job") is not None:
+            _, fut, started, n_lines = state["pdf_job"]
+            elapsed = time.monotonic() - started
+            st.progress(min(0.95, elapsed / max(estimated_seconds(n_lines), 0.1)), text="Génération du PDF…")
+            # rerun rapide : les étapes mémorisées rendent chaque passage quasi gratuit
+            wait([fut], timeout=PDF_POLL_S)
+            st.rerun()
+
+    if speculative:
+        @st.fragment(run_every=1.0)
+        def speculative_pdf():
+            seen = state.get("stable")
+            if state.get("saved_draft") == draft_fp:
+                return
+            if seen is None or seen[0] != draft_fp:
+                state["stable"] = (draft_fp, time.monotonic())
+            elif time.monotonic() - seen[1] >= SPECULATIVE_DELAY_S:
+                if not devis_num.strip():
+                    # le n° est imprimé sur le PDF : réservé avant le rendu, sinon celui réservé au clic
+                    # changerait l'empreinte et le PDF préparé serait jeté (un devis abandonné laisse un trou)
+                    st.session_state["next_devis_num"] = quote_history().next_devis_num()
+                    st.rerun()
+                start_pdf_job()
+        speculative_pdf()
+
+last_saved = state.get("last_saved")
+if last_saved is not None:
+    st.caption(f"Devis {last_saved[0]} enregistré dans l'historique.")
+    st.download_button("⬇️ Télécharger le devis (PDF)", data=last_saved[1], file_name=f"{last_saved[0]}.pdf", mime="application/pdf")
+
+# Historique : recherche indexée, rechargement ou duplication d'un devis enregistré
+with st.expander("🗂️ Historique des devis"):
+    col1, col2, col3, col4 = st.columns(4)
+    h_client = col1.text_input("Client commence par", key="h_client")
+    h_period = col2.date_input("Période", value=(), key="h_period")
+    h_metier = col3.selectbox("Métier", ["", *TRADES], format_func=lambda m: m or "tous", key="h_metier")
+    h_cat = catalog(h_metier or metier)
+    h_key = col4.selectbox("Poste", ["", *h_cat.keys_by_label], format_func=lambda k: h_cat[k]["label"] if k else "tous", key="h_key")
+    found = quote_history().search(
+        client=h_client.strip() or None,
+        date_from=h_period[0] if len(h_period) > 0 else None,
+        date_to=h_period[1] if len(h_period) > 1 else None,
+        metier=h_metier or None, key=h_key or None)
+    if found:
+        st.dataframe([{"N°": r["devis_num"], "Date": r["day"], "Client": r["client"], "Métier": r["metier"],
+                       "Lignes": r["n_lines"], "Total TTC €": r["total_c"] / 100} for r in found])
+        picked = st.selectbox("Devis", [r["devis_num"] for r in found], key="h_pick")
+        col1, col2, col3 = st.columns(3)
+        if col1.button("Recharger"):
+            st.session_state["reload_quote"] = (quote_history().load(picked), False)
+            st.rerun()
+        if col2.button("Dupliquer"):
+            st.session_state["reload_quote"] = (quote_history().load(picked), True)
+            st.rerun()
+        # blob lu seulement à la demande, puis gardé pour ce devis : les relances ne relisent pas la base
+        opened = state.get("history_pdf")
+        if opened is not None and opened[0] == picked:
+            if opened[1]:
+                col3.download_button("⬇️ PDF enregistré", data=opened[1], file_name=f"{picked}.pdf", mime="application/pdf")
+            else:
+                col3.caption("Pas de PDF enregistré.")
+        elif col3.button("📄 Ouvrir le PDF enregistré"):
+            state["history_pdf"] = (picked, quote_history().pdf(picked))
+            st.rerun()
+    else:
+        st.caption("Aucun devis enregistré ne correspond.")
+
+# Diagnostic : compteurs par règle et temps par étape. Ils sont communs à tout le serveur :
+# activés au lancement (DEVIS_METRICS=1), jamais par un widget d'une session.
+if METRICS.enabled:
+    with st.expander("🔧 Diagnostic (instrumentation)"):
+        if st.button("Remettre les compteurs à zéro"):
+            METRICS.reset()
+        data = METRICS.to_dict()
+        if data["stages"]:
+            st.write("**Étapes**")
+            st.dataframe([{"Étape": k, "Appels": v["calls"], "Total ms": round(v["ns"] / 1e6, 3)} for k, v in data["stages"].items()])
+        if data["rules"]:
+            st.write("**Règles** (triées par temps)")
+            st.dataframe(sorted(
+                ({"Règle": k, "Évaluée": v["evaluated"], "Déclenchée": v["matches"], "Total ms": round(v["ns"] / 1e6, 3),
+                  "Origine qté": ", ".join(f"{src}: {n}" for src, n in v["qty_sources"].items())} for k, v in data["rules"].items()),
+                key=lambda r: -r["Total ms"]))
+            st.caption("Jamais déclenchées : " + ", ".join(METRICS.dead_rules([r[0] for r in couvreur_rules()[0]])))
+            col1, col2 = st.columns(2)
+            col1.download_button("Export Prometheus", data=METRICS.to_prometheus(), file_name="devis_metrics.prom", mime="text/plain")
+            col2.download_button("Export JSON", data=json.dumps(data, indent=2, ensure_ascii=False), file_name="devis_metrics.json", mime="application/json")
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from devis import history
+
+@pytest.fixture
+def quotes(tmp_path, monkeypatch):
+    """Historique vide dans un fichier temporaire, installé comme historique partagé de l'app."""
+    h = history.QuoteHistory(str(tmp_path / "devis_history.db"))
+    monkeypatch.setattr(history, "_history", h)
+    return h
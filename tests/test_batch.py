@@ -0,0 +1,30 @@
+import csv
+import json
+
+import batch_devis
+
+def _rows(out):
+    with open(out / "summary.csv", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def test_bad_records_become_error_rows(tmp_path):
+    src = tmp_path / "demandes.jsonl"
+    src.write_text("\n".join([
+        json.dumps({"id": "ok", "client": "Mme BLANC", "text": "pose noue 6 ml"}),
+        "[1, 2]",
+        json.dumps({"id": "client", "client": 123, "text": "solin 8 ml"}),
+        json.dumps({"id": "metier", "metier": "../bench/baseline"}),
+        "pas du json",
+    ]) + "\n", encoding="utf-8")
+    out = tmp_path / "out"
+    args = ["--out", str(out), "--workers", "1"]
+    assert batch_devis.main([str(src), *args]) == 1
+    rows = {row["id"]: row for row in _rows(out)}
+    assert set(rows) == {"ok", "2", "client", "metier", "5"}
+    assert not rows["ok"]["error"] and rows["ok"]["pdf"]
+    assert all(rows[i]["error"] for i in ("2", "client", "metier", "5"))
+
+    # relance : les erreurs sont retentées sans doubler leur ligne
+    batch_devis.main([str(src), *args])
+    ids = [row["id"] for row in _rows(out)]
+    assert sorted(ids) == sorted(set(ids)) == sorted(rows)
@@ -0,0 +1,34 @@
+import pytest
+
+from devis import extract_couvreur_from_text_advanced
+from devis.fuzzy import TrigramIndex, trade_index
+
+def test_fuzzy_search_and_best_match():
+    index = TrigramIndex([("a", "Gouttière alu G300"), ("b", "Gouttière zinc"), ("c", "Faîtage scellé")])
+    assert len(index) == 3
+    assert {v for _, v in index.search("goutiere")} == {"a", "b"}
+    assert index.search("goutt alu")[0][1] == "a"
+    assert index.search("") == []
+    assert index.best_match("faitage scelle")[1] == "c"
+    assert index.best_match("gouttiere") is None  # deux gouttières à égalité : ambigu
+
+def test_fuzzy_catalog_index_is_built_once_per_catalog_version():
+    index = trade_index("couvreur")
+    assert trade_index("couvreur") is index
+    assert "gouttiere_zinc_ml" in [v for _, v in index.search("goutiere zinc", limit=3)]
+
+# exemples de la demande : fautes, accents absents, mot coupé, tournure hors des règles
+@pytest.mark.parametrize("text, key, qty", [
+    ("goutiere alu 22 ml", "gouttiere_alu_g300_ml", 22.0),
+    ("hydro fuge 100 m2", "nettoyage_toiture_hydrofuge", 100.0),
+    ("hydro fuge colore 80 m2", "nettoyage_toiture_hydrofuge_colore", 80.0),
+    ("faitage scelle 12 ml", "realisation_faitage_maconne_ml", 12.0),
+    ("velux a deposer", "depose_fenetre_toit_fermeture_forfait", 1.0),
+])
+def test_fallback_recognises_misspelled_clauses(text, key, qty):
+    lines = [ln for ln in extract_couvreur_from_text_advanced(text) if ln.get("key")]
+    assert [(ln["key"], ln["qty"]) for ln in lines] == [(key, qty)]
+    assert "approx" in lines[0]
+
+def test_fallback_ignores_ambiguous_clauses():
+    assert extract_couvreur_from_text_advanced("pose") == []
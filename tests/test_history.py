@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from conftest import ROOT
+
+APP = os.path.join(ROOT, "streamlit_app.py")
+LINES = [{"key": "pose_noue_ml", "label": "Pose noue", "unit": "ml", "unit_price": 120.0, "qty": 6.0}]
+
+def test_save_refuses_to_replace_unless_asked(quotes):
+    quotes.save("D1", "couvreur", {"name": "A"}, LINES, 10)
+    with pytest.raises(ValueError):
+        quotes.save("D1", "couvreur", {"name": "B"}, LINES, 10)
+    assert quotes.load("D1")["header"]["client"]["name"] == "A"
+    quotes.save("D1", "couvreur", {"name": "B"}, LINES, 10, replace=True)
+    assert quotes.load("D1")["header"]["client"]["name"] == "B"
+
+def _generate(at, timeout=20.0):
+    """Clique « Générer le PDF » et relance jusqu'à l'enregistrement ; renvoie le n° enregistré."""
+    at.button[[b.label for b in at.button].index("Générer le PDF")].click().run()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        saved = [c.value for c in at.caption if "enregistré dans l'historique" in c.value]
+        if saved:
+            return saved[0].split()[1]
+        assert not at.error, at.error[0].value
+        at.run()
+    raise AssertionError("devis jamais enregistré")
+
+def test_next_quote_does_not_overwrite_previous(quotes):
+    at = AppTest.from_file(APP, default_timeout=30).run()
+    at.text_input(key="client_name").input("Client A")
+    at.text_area(key="user_text").input("pose noue 6 ml").run()
+    first = _generate(at)
+    assert at.text_input(key="devis_num").value == ""
+
+    at.text_input(key="client_name").input("Client B")
+    at.text_area(key="user_text").input("solin 8 ml").run()
+    second = _generate(at)
+    assert second != first
+    assert {r["client"] for r in quotes.search()} == {"Client A", "Client B"}
+    assert quotes.load(first)["header"]["client"]["name"] == "Client A"
+    assert quotes.pdf(first)
+
+def test_existing_number_is_replaced_only_after_reload(quotes):
+    quotes.save("D20260101-001", "couvreur", {"name": "Client A"}, LINES, 10, pdf=b"%PDF")
+    at = AppTest.from_file(APP, default_timeout=30).run()
+    at.text_input(key="client_name").input("Client B")
+    at.text_input(key="devis_num").input("D20260101-001").run()
+    at.button[[b.label for b in at.button].index("Générer le PDF")].click().run()
+    assert at.error and "déjà celui d'un autre devis" in at.error[0].value
+    assert quotes.load("D20260101-001")["header"]["client"]["name"] == "Client A"
+
+    at.button[[b.label for b in at.button].index("Recharger")].click().run()
+    assert at.text_input(key="devis_num").value == "D20260101-001"
+    at.text_input(key="client_name").input("Client A (corrigé)").run()
+    assert _generate(at) == "D20260101-001"
+    assert [r["client"] for r in quotes.search()] == ["Client A (corrigé)"]
+
+def test_stored_pdf_is_read_only_on_demand(quotes, monkeypatch):
+    quotes.save("D20260101-001", "couvreur", {"name": "Client A"}, LINES, 10, pdf=b"%PDF-stored")
+    reads = []
+    real_pdf = quotes.pdf
+    monkeypatch.setattr(quotes, "pdf", lambda num: reads.append(num) or real_pdf(num))
+    at = AppTest.from_file(APP, default_timeout=30).run()
+    at.slider(key="tva_rate").set_value(20).run()
+    assert reads == []
+    at.button[[b.label for b in at.button].index("📄 Ouvrir le PDF enregistré")].click().run()
+    at.slider(key="tva_rate").set_value(10).run()
+    assert reads == ["D20260101-001"]
+    assert at.get("download_button")
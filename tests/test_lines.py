@@ -0,0 +1,38 @@
+import devis.pdf
+from devis.lines import QuoteLines, compute_totals, to_cents
+
+def _line(qty, unit_price, label="Poste"):
+    return {"key": "", "label": label, "unit": "u", "unit_price": unit_price, "qty": qty}
+
+def test_line_total_rounds_half_up_to_the_cent():
+    assert list(QuoteLines([_line(0.5, 0.05)]).total_c) == [3]    # 0,025 € → 0,03 €
+    assert list(QuoteLines([_line(3, 0.335)]).total_c) == [102]   # PU 0,335 → 0,34 €, ligne 1,02 €
+    assert list(QuoteLines([_line(-0.5, 0.05)]).total_c) == [-3]  # avoir : symétrique
+
+def test_subtotal_is_the_sum_of_rounded_lines():
+    qlines = QuoteLines([_line(0.5, 0.05), _line(0.5, 0.05)])
+    assert qlines.subtotal_c == 6  # et non 0,05 € arrondi une seule fois
+
+def test_tva_at_5_5_is_rounded_once_on_the_subtotal():
+    assert QuoteLines([_line(1, 10.10)]).totals_c(5.5) == (1010, 56, 1066)  # 55,55 c → 56 c
+    assert QuoteLines([_line(1, 10.01)]).totals_c(5.5) == (1001, 55, 1056)  # 55,055 c → 55 c
+    assert compute_totals([_line(1, 10.10)], 5.5) == (10.10, 0.56, 10.66)
+
+def test_quantities_are_rounded_to_the_hundredth():
+    assert to_cents(0.125) == 13 and to_cents(0.115) == 12
+    qlines = QuoteLines([_line(0.125, 100)])
+    assert list(qlines.qty_c) == [13] and qlines.subtotal_c == 1300
+
+def test_pdf_prints_the_preview_amounts(monkeypatch):
+    lines = [_line(0.5, 0.05, "Joint"), _line(2.333, 19.99, "Solin"), _line(1, 10.10, "Forfait")]
+    qlines = QuoteLines(lines)
+    preview = [f"{t:.2f} €" for *_, t in qlines.rows()]
+    subtotal, tva, total = compute_totals(qlines, 5.5)
+    drawn = []
+    real_right = devis.pdf._right
+    monkeypatch.setattr(devis.pdf, "_right", lambda t, x, y, s, *a: (drawn.append(s), real_right(t, x, y, s, *a)))
+    devis.pdf.make_pdf_devis(company={}, client={}, devis_num="D1", date_str="17/10/2026", lines=lines,
+                             tva_rate=5.5, subtotal=subtotal, tva=tva, total=total, conditions="")
+    assert drawn[2:3 * len(lines):3] == preview  # colonnes qté, PU, total de chaque ligne
+    assert drawn[-5::2] == [f"{subtotal:.2f} €", f"{tva:.2f} €", f"{total:.2f} €"]
+    assert (subtotal, tva, total) == (56.71, 3.12, 59.83)  # 2,333 → 2,33 × 19,99 = 46,58
@@ -0,0 +1,35 @@
+import base64
+import re
+import zlib
+
+from reportlab import rl_config
+
+from devis.pdf import make_pdf_devis
+
+LINES = [{"key": "noue_ml", "label": "Noue zinc", "qty": 6, "unit": "ml", "unit_price": 55}]
+
+def _pdf(**kw):
+    return make_pdf_devis(company={}, client={"name": "Mme BLANC"}, devis_num="D1", date_str="17/10/2026",
+                          lines=LINES, tva_rate=10, subtotal=330, tva=33, total=363, conditions="", **kw).getvalue()
+
+def test_rendering_leaves_reportlab_config_alone():
+    before = rl_config.useA85
+    assert _pdf().startswith(b"%PDF")
+    assert rl_config.useA85 == before
+
+def test_form_xobjects_do_not_clip_what_they_draw():
+    forms = re.findall(rb"/BBox \[ ([^\]]*) \].*?stream\r?\n(.*?)endstream", _pdf(), re.S)
+    assert len(forms) == 2
+    segments = 0
+    for bbox, stream in forms:
+        x0, y0, x1, y1 = map(float, bbox.split())
+        stream = stream.strip()
+        if stream.endswith(b"~>"):  # ASCII85 si la configuration de ReportLab le demande
+            stream = base64.a85decode(stream[:-2])
+        ops = zlib.decompress(stream)
+        for ax, ay, bx, by in re.findall(rb"(-?[\d.]+) (-?[\d.]+) m (-?[\d.]+) (-?[\d.]+) l", ops):
+            segments += 1
+            assert all(y0 <= float(y) <= y1 for y in (ay, by))  # trait sous l'en-tête de tableau
+        for y in re.findall(rb"1 0 0 1 -?[\d.]+ (-?[\d.]+) Tm", ops):
+            assert y0 + 2 <= float(y) <= y1  # place pour les jambages (« g » de Désignation)
+    assert segments == 1
@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+from devis import prices
+
+def _write(path, version, mtime_ns, raw=None):
+    path.write_text(raw if raw is not None else json.dumps(
+        {"trade": "placo", "version": version, "items": {"ba13_m2": {"label": "BA13", "unit": "m2", "unit_price": 30}}}))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+@pytest.fixture
+def catalog_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(prices, "CATALOG_DIR", str(tmp_path))
+    monkeypatch.setattr(prices, "RELOAD_CHECK_S", 0.0)
+    monkeypatch.setattr(prices, "_loaded", {})
+    return tmp_path
+
+def test_half_written_catalog_keeps_last_good_one(catalog_dir):
+    path = catalog_dir / "placo.json"
+    _write(path, "v1", 1_000_000_000)
+    assert prices.catalog("placo").version == "v1"
+
+    _write(path, None, 2_000_000_000, raw='{"trade": "placo", "ite')  # écriture interrompue
+    assert prices.catalog("placo").version == "v1"
+
+    _write(path, "v2", 2_000_000_000)  # même date : le fichier est relu quand même
+    assert prices.catalog("placo").version == "v2"
+
+def test_unreadable_catalog_without_previous_one_raises(catalog_dir):
+    _write(catalog_dir / "placo.json", None, 1_000_000_000, raw="{")
+    with pytest.raises(ValueError):
+        prices.catalog("placo")
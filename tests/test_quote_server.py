@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+import quote_server
+
+async def _exchange(raw):
+    app = quote_server.QuoteServer(workers=1, max_waiting=4)
+    server = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+    try:
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        length = int(next(h.split(":", 1)[1] for h in head.split("\r\n") if h.lower().startswith("content-length")))
+        body = await reader.readexactly(length)
+        try:
+            rest = await asyncio.wait_for(reader.read(), 5) if "Connection: close" in head else b""
+        except ConnectionResetError:
+            rest = b""
+        writer.close()
+        return int(head.split(" ", 2)[1]), json.loads(body), head, rest
+    finally:
+        server.close()
+        app.pool.shutdown()
+
+def _post(payload):
+    body = json.dumps(payload).encode("utf-8")
+    return (f"POST /quote HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+
+@pytest.mark.parametrize("raw", [
+    b"POST /quote HTTP/1.1\r\nHost: x\r\nContent-Length: abc\r\n\r\n",
+    b"POST /quote HTTP/1.1\r\nHost: x\r\nContent-Length: -5\r\n\r\n",
+    _post({"text": "noue 6 ml", "tva": "beaucoup"}),
+    _post({"text": "noue 6 ml", "tva": float("inf")}),
+    _post({"metier": "../bench/baseline"}),
+    _post({"text": ["noue"]}),
+    _post({"client": 123}),
+    _post({"text": "noue 6 ml", "grosse_cheminee": "false"}),
+    _post({"text": "noue 6 ml", "grosse_cheminee": 1}),
+])
+def test_invalid_input_is_a_400(raw):
+    status, payload, _, _ = asyncio.run(_exchange(raw))
+    assert status == 400, payload
+    assert "Traceback" not in payload["error"]
+
+def test_oversized_body_closes_the_connection():
+    smuggled = b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+    raw = (f"POST /quote HTTP/1.1\r\nHost: x\r\nContent-Length: {quote_server.MAX_BODY_BYTES + 1}\r\n\r\n"
+           ).encode("latin-1") + smuggled
+    status, _, head, rest = asyncio.run(_exchange(raw))
+    assert status == 413
+    assert "Connection: close" in head
+    assert rest == b""  # le corps non lu n'est pas servi comme une seconde requête
+
+def test_check_request_normalises_valid_input():
+    req = quote_server.check_request({"text": "noue 6 ml", "tva": "5.5", "client": "Mme BLANC", "grosse_cheminee": True})
+    assert req["metier"] == "couvreur" and req["tva"] == 5.5
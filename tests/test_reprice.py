@@ -0,0 +1,83 @@
+import os
+
+import reprice_devis
+from conftest import ROOT
+from devis.prices import load_catalog_file
+from devis.reprice import PriceTable, chunk_totals, reprice_records
+
+COUVREUR = os.path.join(ROOT, "catalog", "couvreur.json")
+
+def _grid(**prices):
+    cat = load_catalog_file(COUVREUR)
+    for key, price in prices.items():
+        cat.items[key] = dict(cat.items[key], unit_price=price)
+    return cat
+
+def _quote(lines):
+    return {"devis_num": "D1", "metier": "couvreur", "tva_rate": 10, "header": {}, "lines": lines}
+
+# PU saisis dans le sélecteur de postes : joint 350 € (0 au catalogue), noue 100 € (120 au catalogue)
+OVERRIDES = [
+    {"key": "", "label": "Vérification toiture avant travaux", "unit": "forfait", "unit_price": 0.0, "qty": 1.0},
+    {"key": "joint_etancheite_custom", "label": "Joint", "unit": "forfait", "unit_price": 350.0, "qty": 1.0},
+    {"key": "noue_ml", "label": "Pose noue", "unit": "ml", "unit_price": 100.0, "qty": 6.0},
+    {"key": "solin_zinc_alu_ml", "label": "Solin", "unit": "ml", "unit_price": 180.0, "qty": 8.0},
+]
+
+def _totals(table, lines):
+    (_, lines, old, new, error), = reprice_records([_quote(lines)], table, 10)
+    assert error is None
+    return lines, old, new
+
+def test_unchanged_grid_keeps_every_total():
+    current = PriceTable([load_catalog_file(COUVREUR)])
+    table = PriceTable([load_catalog_file(COUVREUR)], previous=current)
+    lines, old, new = _totals(table, OVERRIDES)
+    assert new == old
+    assert [ln["unit_price"] for ln in lines] == [ln["unit_price"] for ln in OVERRIDES]
+
+def test_user_prices_survive_a_price_change():
+    previous = PriceTable([load_catalog_file(COUVREUR)])
+    table = PriceTable([_grid(noue_ml=130.0, solin_zinc_alu_ml=190.0, joint_etancheite_custom=10.0)], previous=previous)
+    lines, old, new = _totals(table, OVERRIDES)
+    prices = {ln.get("key"): ln["unit_price"] for ln in lines}
+    assert prices["joint_etancheite_custom"] == 350.0
+    assert prices["noue_ml"] == 100.0
+    assert prices["solin_zinc_alu_ml"] == 190.0
+    assert new[0] - old[0] == 8 * 1000
+
+def test_chunk_totals_match_quote_lines():
+    from devis.lines import QuoteLines
+    quotes = [OVERRIDES, OVERRIDES[:2], []]
+    assert chunk_totals(quotes, [10, 20, 5.5]) == [QuoteLines(q).totals_c(r) for q, r in zip(quotes, [10, 20, 5.5])]
+
+def test_catalog_edited_in_place_reprices_saved_quotes(quotes):
+    lines = [{"key": "pose_tuile_romane_m2", "label": "Pose tuile romane", "unit": "m²", "unit_price": 49.0, "qty": 10.0},
+             {"key": "noue_ml", "label": "Pose noue", "unit": "ml", "unit_price": 100.0, "qty": 6.0}]  # PU saisi
+    quotes.save("D1", "couvreur", {"name": "Mme BLANC"}, lines, 10)
+    assert [ln["catalog_price"] for ln in quotes.load("D1")["lines"]] == [49.0, 120.0]
+
+    # le catalogue est modifié sur place : pas de grille précédente à donner
+    table = PriceTable([_grid(pose_tuile_romane_m2=52.0, noue_ml=125.0)])
+    (_, lines, old, new, error), = reprice_records(quotes.records(), table, 10)
+    assert error is None
+    assert new[0] - old[0] == 10 * 300
+    prices = {ln["key"]: (ln["unit_price"], ln["catalog_price"]) for ln in lines if ln.get("key")}
+    assert prices == {"pose_tuile_romane_m2": (52.0, 52.0), "noue_ml": (100.0, 120.0)}
+
+    # réenregistré, le devis suit la grille suivante au lieu de rester figé à celle-ci
+    quotes.save("D1", "couvreur", {"name": "Mme BLANC"}, lines, 10, replace=True)
+    table = PriceTable([_grid(pose_tuile_romane_m2=55.0)])
+    (_, lines, _, _, error), = reprice_records(quotes.records(), table, 10)
+    assert error is None
+    assert {ln["key"]: ln["unit_price"] for ln in lines if ln.get("key")} == {"pose_tuile_romane_m2": 55.0, "noue_ml": 100.0}
+
+def test_lines_without_their_catalog_price_need_the_previous_grid():
+    table = PriceTable([_grid(noue_ml=130.0)])
+    (_, _, _, _, error), = reprice_records([_quote(OVERRIDES)], table, 10)
+    assert error and "grille précédente" in error
+
+def test_cli_refuses_the_same_grid_twice(tmp_path, capsys):
+    argv = ["--history", "--prices", COUVREUR, "--old-prices", COUVREUR, "--out", str(tmp_path)]
+    assert reprice_devis.main(argv) == 2
+    assert "même grille" in capsys.readouterr().err
@@ -0,0 +1,42 @@
+from devis.prices import TradeCatalog, load_catalog_file
+from devis.reprice import PriceTable, reprice_records
+from devis.router import KEYWORD_WEIGHT, LABEL_WORD_WEIGHT, TradeRouter, apply_rules_by_trade, extract_multi
+
+from conftest import ROOT
+
+VERIFICATION = "Vérification toiture avant travaux"
+
+def test_rule_lines_keep_their_trade_in_a_multi_trade_quote(quotes):
+    lines, _ = extract_multi("pose noue 6 ml, solin 8 ml", default_trade="placo")
+    lines = apply_rules_by_trade(lines, "placo")
+    rule_lines = [ln for ln in lines if ln["label"] == VERIFICATION]
+    assert len(rule_lines) == 1
+    assert rule_lines[0]["metier"] == "couvreur" and rule_lines[0]["rule"]
+
+    quotes.save("D1", "placo", {"name": "Mme BLANC"}, lines, 10)
+    rec = quotes.load("D1")
+    table = PriceTable([load_catalog_file(f"{ROOT}/catalog/couvreur.json")])
+    (_, repriced, old, new, error), = reprice_records([rec], table, 10)
+    assert error is None and new == old
+    assert [ln["label"] for ln in repriced].count(VERIFICATION) == 1
+
+def _cat(trade, items=None, rules=(), keywords=()):
+    items = items if items is not None else {"dalle_m2": {"label": "Dalle béton", "unit": "m2", "unit_price": 50}}
+    return TradeCatalog(trade, "t", items, rules, keywords)
+
+def test_route_scores_short_keywords_and_shared_words():
+    router = TradeRouter([
+        _cat("maconnerie", keywords=["mur", "enduit façade"]),
+        _cat("placo", {"enduit_m2": {"label": "Enduit de lissage", "unit": "m2", "unit_price": 12}}, keywords=["plafond"]),
+    ])
+    assert router.scores("monter un mur") == {"maconnerie": KEYWORD_WEIGHT}
+    assert router.scores("réparer les murs") == {"maconnerie": KEYWORD_WEIGHT}
+    # « enduit » : mot-clé d'un métier, mot de libellé de l'autre, partagé entre les deux
+    assert router.scores("enduit") == {"maconnerie": KEYWORD_WEIGHT / 2, "placo": LABEL_WORD_WEIGHT / 2}
+    assert router.scores("bonjour, un devis svp") == {}
+
+def test_route_real_catalogs():
+    _, routed = extract_multi("monter un mur en parpaing et poser une gouttière")
+    assert [t for t, _ in routed] == ["maconnerie", "couvreur"]
+    # mots courants de la langue : ne désignent aucun métier
+    assert extract_multi("le montant total doit rester sous 5000, livraison sur rail")[1] == []
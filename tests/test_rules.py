@@ -0,0 +1,32 @@
+import pytest
+
+from devis.prices import TradeCatalog
+from devis.rules import CompiledRules, apply_compiled
+
+ITEMS = {"dalle_m2": {"label": "Dalle béton", "unit": "m2", "unit_price": 50, "group": "Sols"}}
+
+def _rules(*rules):
+    return CompiledRules(TradeCatalog("maconnerie", "t", ITEMS, list(rules)))
+
+@pytest.mark.parametrize("rule, message", [
+    ({"target": "inconnu_m2", "set": {"unit_price": 1}}, "poste visé inconnu"),
+    ({"if_any_group": "vide", "add_line": {"label": "x"}}, "aucun poste"),
+    ({"if_option": "o", "if_any_key": ["dalle_m2"], "add_line": {"label": "x"}}, "une seule condition"),
+    ({"if_any_key": ["dalle_m2"]}, "sans action"),
+    ({"add_line": {"label": "x"}, "position": "middle"}, "position inconnue"),
+])
+def test_invalid_rules_are_rejected_at_compile_time(rule, message):
+    with pytest.raises(ValueError, match=message):
+        _rules(rule)
+
+def test_rules_add_and_patch_lines():
+    rules = _rules(
+        {"if_any_group": "Sols", "add_line": {"label": "Nettoyage chantier", "unit": "forfait", "unit_price": 90, "qty": 1}},
+        {"target": "dalle_m2", "if_option": "urgent", "set": {"unit_price": 60}},
+    )
+    dalle = {"key": "dalle_m2", "label": "Dalle béton", "unit": "m2", "unit_price": 50, "qty": 10}
+    assert apply_compiled(rules, []) == []
+    lines = apply_compiled(rules, [dalle], urgent=True)
+    assert [ln["unit_price"] for ln in lines] == [60, 90]
+    assert lines[1]["rule"] and lines[1]["metier"] == "maconnerie"
+    assert dalle["unit_price"] == 50  # les lignes reçues ne sont pas modifiées